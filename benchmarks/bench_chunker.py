@@ -0,0 +1,88 @@
+# benchmarks/bench_chunker.py — chunker a span (un passaggio) vs implementazione precedente
+#   python -m benchmarks.bench_chunker [--chars 2000000] [--repeat 3] [--pdf file.pdf]
+import argparse
+import random
+import time
+from lexie import tokens
+from lexie.tools import analyze_document as ad
+
+
+# --- implementazione precedente (riferimento per output e tempi) ---
+def legacy_chunk_by_tokens(text: str, max_tokens=350, overlap_tokens=60, min_tokens=200, chars_per_token=4.0):
+    if not text: return []
+    max_c, ovl_c = max(1, int(max_tokens * chars_per_token)), int(overlap_tokens * chars_per_token)
+    out, i, N = [], 0, len(text)
+    while i < N:
+        # ricerca all'indietro, carattere per carattere, della fine frase
+        j = min(N, i + max_c)
+        k = j
+        while k > i + int(0.6 * max_c) and k < N and text[k-1] not in ".!?":
+            k -= 1
+        if k <= i + int(0.6 * max_c): k = j
+        chunk = text[i:k].strip()
+        if chunk: out.append(chunk)
+        i = N if k >= N else max(i + 1, k - ovl_c)
+    # merge dei chunk corti per concatenazione ripetuta
+    merged, buf = [], ""
+    for ch in out:
+        if ad._approx_tokens(ch) < min_tokens: buf = (buf + "\n" + ch).strip()
+        else:
+            if buf: merged.append(buf); buf = ""
+            merged.append(ch)
+    if buf: merged.append(buf)
+    return merged
+
+
+def synthetic_text(n_chars: int, seed: int = 0) -> str:
+    """Testo "legale" con frasi di lunghezza varia, paragrafi corti e tratti senza punteggiatura."""
+    rng = random.Random(seed)
+    words = ("data", "controller", "processing", "consent", "lawful", "basis", "personal", "subject",
+             "transfer", "safeguards", "provider", "system", "risk", "oversight", "Article", "shall")
+    parts, size = [], 0
+    while size < n_chars:
+        kind = rng.random()
+        if kind < 0.1:      # elenco puntato: righe corte senza punto
+            s = "\n".join("- " + " ".join(rng.choices(words, k=rng.randint(2, 6))) for _ in range(rng.randint(3, 12)))
+        elif kind < 0.15:   # tabella / blocco lungo senza fine frase
+            s = " ".join(rng.choices(words, k=rng.randint(300, 900)))
+        else:
+            s = " ".join(rng.choices(words, k=rng.randint(6, 40))).capitalize() + rng.choice(".!?")
+        parts.append(s)
+        size += len(s) + 1
+    return " ".join(parts)[:n_chars]
+
+
+def _best(fn, repeat):
+    best, out = float("inf"), None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        out = fn()
+        best = min(best, time.perf_counter() - t0)
+    return best, out
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--chars", type=int, default=2_000_000)
+    ap.add_argument("--repeat", type=int, default=3)
+    ap.add_argument("--pdf", help="usa il testo di un PDF invece del testo sintetico")
+    args = ap.parse_args()
+
+    tokens.set_counter(tokens.CharHeuristic())   # si misura il chunking, non il tokenizer
+    if args.pdf:
+        from lexie.loaders import load_file_text
+        text = "\n\n".join(p["text"] for p in load_file_text(args.pdf))
+    else:
+        text = synthetic_text(args.chars)
+
+    p = (ad.CHUNK_MAX_TOKENS, ad.CHUNK_OVERLAP_TOKENS, ad.CHUNK_MIN_TOKENS)
+    t_old, old = _best(lambda: legacy_chunk_by_tokens(text, *p), args.repeat)
+    t_new, new = _best(lambda: ad._chunk_by_tokens(text, *p), args.repeat)
+    print(f"text: {len(text):,} chars, {len(new)} chunks (max {p[0]} / overlap {p[1]} / min {p[2]} tokens)")
+    print(f"legacy : {t_old * 1000:9.1f} ms")
+    print(f"spans  : {t_new * 1000:9.1f} ms   ({t_old / t_new:.1f}x)")
+    print("output identical" if old == new else "⚠️ output differs")
+
+
+if __name__ == "__main__":
+    main()
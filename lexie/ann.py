@@ -0,0 +1,81 @@
+# lexie/ann.py — indice ANN IVF (k-means sferico) in puro NumPy
+from pathlib import Path
+import numpy as np
+from .corpus import replace_file
+
+IVF_FILE = "ivf.npz"
+
+
+class IVFIndex:
+    """
+    Inverted file: ogni chunk è assegnato al centroide più vicino (coseno).
+    In ricerca si visitano solo le `nprobe` liste più vicine alla query:
+    nprobe alto → recall più alta, latenza maggiore; nprobe = n_lists → ricerca esatta.
+    """
+
+    def __init__(self, centroids, ptr, members, model: str = "", source_sha1: str = None):
+        self.centroids = np.asarray(centroids, dtype=np.float32)
+        self.ptr = np.asarray(ptr, dtype=np.int64)          # liste in formato CSR
+        self.members = np.asarray(members, dtype=np.int64)
+        self.model = model
+        self.source_sha1 = source_sha1
+
+    def __len__(self):
+        return len(self.members)
+
+    @property
+    def n_lists(self) -> int:
+        return len(self.centroids)
+
+    @classmethod
+    def build(cls, emb, n_lists: int = None, iters: int = 20, seed: int = 0,
+              model: str = "", source_sha1: str = None) -> "IVFIndex":
+        x = np.asarray(emb, dtype=np.float32)
+        n = x.shape[0]
+        n_lists = max(1, min(n, int(n_lists or round(np.sqrt(n)))))
+        rng = np.random.default_rng(seed)
+        cent = x[rng.choice(n, size=n_lists, replace=False)].copy()
+        assign = np.full(n, -1, dtype=np.int64)
+        for _ in range(iters):
+            new = _nearest(x, cent)
+            if np.array_equal(new, assign):
+                break
+            assign = new
+            sums = np.zeros_like(cent)
+            np.add.at(sums, assign, x)
+            counts = np.bincount(assign, minlength=n_lists)
+            empty = np.flatnonzero(counts == 0)
+            if empty.size:
+                # liste vuote: riparti dai punti peggio serviti dal proprio centroide
+                fit = np.einsum("ij,ij->i", x, cent[assign])
+                sums[empty] = x[np.argsort(fit)[:empty.size]]
+            cent = sums / (np.linalg.norm(sums, axis=1, keepdims=True) + 1e-9)
+        order = np.argsort(assign, kind="stable")
+        ptr = np.zeros(n_lists + 1, dtype=np.int64)
+        ptr[1:] = np.cumsum(np.bincount(assign, minlength=n_lists))
+        return cls(cent, ptr, order, model, source_sha1)
+
+    def probe(self, q, nprobe: int) -> np.ndarray:
+        """Indici dei chunk nelle `nprobe` liste più vicine alla query (ordinati)."""
+        nprobe = max(1, min(int(nprobe), self.n_lists))
+        cs = self.centroids @ np.asarray(q, dtype=np.float32)
+        lists = np.argpartition(-cs, nprobe - 1)[:nprobe] if nprobe < self.n_lists else np.arange(self.n_lists)
+        parts = [self.members[self.ptr[l]:self.ptr[l + 1]] for l in lists]
+        return np.sort(np.concatenate(parts)) if parts else np.empty(0, dtype=np.int64)
+
+    def save(self, directory: Path) -> Path:
+        arrays = dict(centroids=self.centroids, ptr=self.ptr, members=self.members,
+                      model=np.array(self.model, dtype=str), source_sha1=np.array(self.source_sha1 or "", dtype=str))
+        return replace_file(Path(directory) / IVF_FILE, lambda f: np.savez(f, **arrays))
+
+    @classmethod
+    def load(cls, directory: Path) -> "IVFIndex":
+        with np.load(Path(directory) / IVF_FILE, allow_pickle=False) as z:
+            return cls(z["centroids"], z["ptr"], z["members"], str(z["model"]), str(z["source_sha1"]) or None)
+
+
+def _nearest(x: np.ndarray, cent: np.ndarray, batch: int = 8192) -> np.ndarray:
+    out = np.empty(x.shape[0], dtype=np.int64)
+    for a in range(0, x.shape[0], batch):
+        out[a:a + batch] = np.argmax(x[a:a + batch] @ cent.T, axis=1)
+    return out
@@ -0,0 +1,244 @@
+# lexie/batch.py — analisi batch di una cartella (o manifest) di documenti, con resume
+#   python -m lexie.batch <cartella|manifest.txt|manifest.csv> [--out DIR] [--workers N] [--llm-concurrency M]
+import argparse
+import csv
+import hashlib
+import json
+import multiprocessing
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from pathlib import Path
+from typing import Dict, List, Optional
+from .config import (TOP_K, POLICIES, OUTPUT_DIR, BATCH_WORKERS, BATCH_LLM_CONCURRENCY, LLM_TIMEOUT,
+                     RESULT_CACHE_ENABLED, level_from_score)
+from .call_agent import _fingerprint, get_result_cache, result_cache_key
+from .tools import analyze_document
+
+SUMMARY_FIELDS = ["document", "status", "risk_score", "risk_level", "violations_gdpr", "violations_ai_act",
+                  "partial", "pages_read", "pages_total", "seconds", "result_file", "error"]
+
+
+def discover(source, pattern: str = "*.pdf") -> List[Path]:
+    """Documenti da una cartella (ricorsiva) o da un manifest: .txt un path per riga, .csv colonna `path`."""
+    src = Path(source)
+    if src.is_dir():
+        return sorted(p for p in src.rglob(pattern) if p.is_file())
+    if src.suffix.lower() == ".csv":
+        with open(src, newline="", encoding="utf-8") as f:
+            paths = [row["path"].strip() for row in csv.DictReader(f) if (row.get("path") or "").strip()]
+    else:
+        lines = src.read_text(encoding="utf-8").splitlines()
+        paths = [ln.strip() for ln in lines if ln.strip() and not ln.lstrip().startswith("#")]
+    # path relativi rispetto al manifest
+    return [p if p.is_absolute() else (src.parent / p) for p in map(Path, paths)]
+
+
+def result_file(out_dir: Path, doc: Path) -> Path:
+    h = hashlib.sha1(str(doc.resolve()).encode("utf-8")).hexdigest()[:8]
+    return Path(out_dir) / "results" / f"{doc.stem}-{h}.json"
+
+
+def _write_json(path: Path, data) -> None:
+    # scrittura atomica: un'interruzione non lascia risultati a metà (che il resume prenderebbe per buoni)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(path.name + ".tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+    os.replace(tmp, path)
+
+
+def _init_worker():
+    # il parallelismo è tra documenti: niente pool di estrazione annidati nei worker
+    from . import loaders
+    loaders.PDF_WORKERS = 1
+
+
+def _prepare_job(path: str, top_k: int, read_strategy: Optional[str]):
+    """Fasi CPU (estrazione, chunking, retrieval, prompt): eseguita nel pool di processi."""
+    return analyze_document.prepare({"mode": "document", "document_path": path, "top_k": top_k,
+                                     "read_strategy": read_strategy})
+
+
+def _analyze_job(prep, timeout: float, llm_pool=None):
+    """Fase I/O (chiamate LLM) + merge: eseguita nel pool di thread; le due chiamate su llm_pool."""
+    raw_gdpr, raw_ai, errors = analyze_document.analyze(prep, timeout, executor=llm_pool)
+    result = analyze_document.merge(prep, raw_gdpr, raw_ai, errors)
+    result["risk_level"] = level_from_score(int(result.get("risk_score", 0)))
+    return result
+
+
+class BatchRunner:
+    """
+    Pipeline a due stadi: prepare su un pool di processi (CPU), analisi LLM su un pool di
+    thread limitato (I/O). Al più workers + llm_concurrency documenti in volo, così i prep
+    non si accumulano in memoria. Un JSON per documento in out_dir/results, summary.csv a fine run.
+    Resume: i documenti con un risultato per lo stesso contenuto (sha256) vengono saltati.
+    """
+
+    def __init__(self, out_dir, workers: int = None, llm_concurrency: int = None, top_k: int = None,
+                 read_strategy: str = None, resume: bool = True, timeout: float = None):
+        self.out_dir = Path(out_dir)
+        self.workers = BATCH_WORKERS if workers is None else max(0, int(workers))
+        self.llm_concurrency = max(1, int(llm_concurrency or BATCH_LLM_CONCURRENCY))
+        self.top_k = int(top_k or TOP_K)
+        self.read_strategy = read_strategy
+        self.resume = resume
+        self.timeout = LLM_TIMEOUT if timeout is None else timeout
+
+    def _payload(self, doc: Path) -> Dict:
+        return {"mode": "document", "document_path": str(doc), "top_k": self.top_k,
+                "read_strategy": self.read_strategy}
+
+    def _done(self, doc: Path, fingerprint: str) -> Optional[Dict]:
+        path = result_file(self.out_dir, doc)
+        if not (self.resume and path.exists()):
+            return None
+        try:
+            data = json.loads(path.read_text(encoding="utf-8"))
+        except Exception:
+            return None
+        return data if (data.get("_meta") or {}).get("fingerprint") == fingerprint else None
+
+    def _save(self, doc: Path, result: Dict, fingerprint: str, seconds: float, cached: bool = False) -> Dict:
+        result.setdefault("_meta", {}).update({
+            "mode": "document", "document": str(doc), "fingerprint": fingerprint, "top_k": self.top_k,
+            "timestamp": time.strftime("%Y%m%d-%H%M%S"), "seconds": round(seconds, 3),
+        })
+        if cached:
+            result["_meta"]["cached"] = True
+        _write_json(result_file(self.out_dir, doc), result)
+        return self._row(doc, result, "cached" if cached else "ok")
+
+    def _row(self, doc: Path, result: Dict = None, status: str = "ok", error: str = "") -> Dict:
+        result = result or {}
+        meta = result.get("meta") or {}
+        reading = meta.get("reading") or {}
+        laws = [(v.get("law") or "").lower() for v in result.get("violations") or []]
+        return {
+            "document": str(doc), "status": status,
+            "risk_score": result.get("risk_score", ""), "risk_level": result.get("risk_level", ""),
+            "violations_gdpr": sum(l == "gdpr" for l in laws) if result else "",
+            "violations_ai_act": sum(l == "ai act" for l in laws) if result else "",
+            "partial": bool(meta.get("partial")) if result else "",
+            "pages_read": reading.get("pages_read", meta.get("pages", "")), "pages_total": reading.get("pages_total", ""),
+            "seconds": (result.get("_meta") or {}).get("seconds", ""),
+            "result_file": str(result_file(self.out_dir, doc)) if result else "", "error": error,
+        }
+
+    def run(self, docs: List[Path]) -> List[Dict]:
+        docs = [Path(d) for d in docs]
+        rows: Dict[Path, Dict] = {}
+        todo = []
+        n = len(docs)
+        for doc in docs:
+            if not doc.exists():
+                rows[doc] = self._row(doc, status="error", error="file not found")
+                continue
+            fp = _fingerprint("document", {"document_path": str(doc)})
+            prev = self._done(doc, fp)
+            if prev is not None:
+                rows[doc] = self._row(doc, prev, "skipped")
+                continue
+            key = None
+            if RESULT_CACHE_ENABLED:
+                key = result_cache_key("document", self._payload(doc), POLICIES, self.top_k)
+                hit = get_result_cache().get(key)
+                if hit is not None:
+                    rows[doc] = self._save(doc, hit, fp, 0.0, cached=True)
+                    continue
+            todo.append((doc, fp, key))
+        print(f"[Lexie batch] {n} documents: {len(todo)} to analyze, {n - len(todo)} done/cached/missing → {self.out_dir}")
+
+        if self.workers > 0:
+            # spawn come i pool di loaders e reports: niente fork di un processo con thread (e torch) attivi
+            cpu = ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker,
+                                      mp_context=multiprocessing.get_context("spawn"))
+        else:
+            cpu = ThreadPoolExecutor(max_workers=1, thread_name_prefix="lexie-prepare")   # in-process (debug/test)
+        io = ThreadPoolExecutor(max_workers=self.llm_concurrency, thread_name_prefix="lexie-batch")
+        # due chiamate (GDPR + AI Act) per documento in analisi: nessuna aspetta un thread libero
+        # consumando il proprio timeout (il _LLM_POOL condiviso ha 8 thread fissi)
+        llm = ThreadPoolExecutor(max_workers=2 * self.llm_concurrency, thread_name_prefix="lexie-batch-llm")
+        queue = iter(todo)
+        in_flight = {}
+
+        def submit_next():
+            item = next(queue, None)
+            if item is not None:
+                f = cpu.submit(_prepare_job, str(item[0]), self.top_k, self.read_strategy)
+                in_flight[f] = (item, "prepare", time.perf_counter())
+
+        try:
+            for _ in range(max(1, self.workers) + self.llm_concurrency):
+                submit_next()
+            done_count = 0
+            while in_flight:
+                finished, _ = wait(list(in_flight), return_when=FIRST_COMPLETED)
+                for f in finished:
+                    (doc, fp, key), stage, t0 = in_flight.pop(f)
+                    try:
+                        out = f.result()
+                    except Exception as e:
+                        rows[doc] = self._row(doc, status="error", error=f"{stage}: {type(e).__name__}: {e}")
+                        done_count += 1
+                        print(f"[{done_count}/{len(todo)}] ❌ {doc.name}: {stage} failed: {e}")
+                        submit_next()
+                        continue
+                    if stage == "prepare":
+                        g = io.submit(_analyze_job, out, self.timeout, llm)
+                        in_flight[g] = ((doc, fp, key), "analyze", t0)
+                        continue
+                    if key and not (out.get("meta") or {}).get("partial"):
+                        get_result_cache().set(key, out)
+                    rows[doc] = self._save(doc, out, fp, time.perf_counter() - t0)
+                    done_count += 1
+                    print(f"[{done_count}/{len(todo)}] ✅ {doc.name}: risk {out.get('risk_score')} ({out.get('risk_level')})")
+                    submit_next()
+        finally:
+            # interruzione: i risultati già scritti restano validi per il resume
+            for f in in_flight:
+                f.cancel()
+            cpu.shutdown(wait=not in_flight, cancel_futures=True)
+            io.shutdown(wait=not in_flight, cancel_futures=True)
+            llm.shutdown(wait=False, cancel_futures=True)
+            ordered = [rows[d] for d in docs if d in rows]
+            self.write_summary(ordered)
+        return ordered
+
+    def write_summary(self, rows: List[Dict]) -> Path:
+        path = self.out_dir / "summary.csv"
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(path.name + ".tmp")
+        with open(tmp, "w", newline="", encoding="utf-8") as f:
+            w = csv.DictWriter(f, fieldnames=SUMMARY_FIELDS)
+            w.writeheader()
+            w.writerows(rows)
+        os.replace(tmp, path)
+        return path
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(prog="python -m lexie.batch", description="Analyze a folder or manifest of documents.")
+    ap.add_argument("source", help="folder (recursive) or manifest (.txt one path per line, .csv with a 'path' column)")
+    ap.add_argument("--out", help="output folder (default runtime/outputs/batch/<source name>); reuse it to resume")
+    ap.add_argument("--pattern", default="*.pdf", help="file pattern when source is a folder")
+    ap.add_argument("--workers", type=int, default=None, help="processes for extraction/retrieval (0 = in-process)")
+    ap.add_argument("--llm-concurrency", type=int, default=None, help="documents analyzed by the LLM at the same time")
+    ap.add_argument("--top-k", type=int, default=None)
+    ap.add_argument("--read-strategy", choices=analyze_document.READ_STRATEGIES, default=None)
+    ap.add_argument("--no-resume", action="store_true", help="re-analyze documents that already have a result")
+    args = ap.parse_args(argv)
+
+    docs = discover(args.source, args.pattern)
+    out = Path(args.out) if args.out else OUTPUT_DIR / "batch" / Path(args.source).stem
+    runner = BatchRunner(out, args.workers, args.llm_concurrency, args.top_k, args.read_strategy,
+                         resume=not args.no_resume)
+    rows = runner.run(docs)
+    failed = sum(r["status"] == "error" for r in rows)
+    print(f"[Lexie batch] summary: {out / 'summary.csv'} ({len(rows) - failed} ok, {failed} failed)")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
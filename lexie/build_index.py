@@ -1,19 +1,62 @@
 import os
 import json
+import numpy as np
+from pathlib import Path
 from .loaders import load_file_text
+from .config import POLICIES, EMBED_MODEL, INDEX_EMB_DTYPE
+from .corpus import write_text_index, file_sha1, replace_file
+from .lexical import BM25Index
+from .ann import IVFIndex
+from . import retriever
+from .embeddings import get_model, encode_texts
 
 def build_policy_chunks(pdf_path, output_path):
     chunks = load_file_text(pdf_path)
-    with open(output_path, "w", encoding="utf-8") as f:
-        for i, chunk in enumerate(chunks):
-            record = {
-                "id": f"{os.path.basename(pdf_path)}::p{i+1}",
-                "text": chunk["text"],
-                "page": chunk["page"]
-            }
-            f.write(json.dumps(record) + "\n")
+    records = [{
+        "id": f"{os.path.basename(pdf_path)}::p{i+1}",
+        "text": chunk["text"],
+        "page": chunk["page"]
+    } for i, chunk in enumerate(chunks)]
+    replace_file(output_path, lambda f: f.write("".join(json.dumps(r) + "\n" for r in records).encode("utf-8")))
     print(f"✅ Wrote {len(chunks)} chunks to {output_path}")
+    return records
+
+def build_policy_embeddings(records, out_dir):
+    """Matrice (n_chunks × dim) + manifest id/pagina, letti da retriever.load_embeddings."""
+    if get_model() is None:
+        print("⚠️ sentence-transformers not available: skipping embeddings (lexical fallback)")
+        return None
+    out_dir = Path(out_dir)
+    src = out_dir / "chunks.jsonl"
+    digest = file_sha1(src) if src.exists() else None
+    mat = encode_texts([r["text"] for r in records]).astype(INDEX_EMB_DTYPE)
+    # file nuovi + rename (i worker hanno la vecchia matrice in memmap); manifest per ultimo
+    replace_file(out_dir / retriever.EMB_FILE, lambda f: np.save(f, mat))
+    manifest = {
+        "model": EMBED_MODEL,
+        "dtype": str(mat.dtype),
+        "dim": int(mat.shape[1]),
+        "count": int(mat.shape[0]),
+        "ids": [r["id"] for r in records],
+        "pages": [r["page"] for r in records],
+        "source_sha1": digest,
+    }
+    replace_file(out_dir / retriever.EMB_MANIFEST, lambda f: f.write(json.dumps(manifest).encode("utf-8")))
+    print(f"✅ Wrote {mat.shape[0]}×{mat.shape[1]} embeddings to {out_dir / retriever.EMB_FILE}")
+    ivf = IVFIndex.build(mat, model=EMBED_MODEL, source_sha1=digest)
+    print(f"✅ Wrote IVF index ({ivf.n_lists} lists) to {ivf.save(out_dir)}")
+    return mat
+
+def build_policy(name: str):
+    pdir = retriever.POLICY_DIR / name
+    records = build_policy_chunks(str(pdir / f"{name}.pdf"), str(pdir / "chunks.jsonl"))
+    write_text_index(records, pdir)
+    print(f"✅ Wrote compact text index to {pdir}")
+    bm25 = BM25Index.build((r["text"] for r in records), source_sha1=file_sha1(pdir / "chunks.jsonl"))
+    print(f"✅ Wrote BM25 index ({len(bm25.terms)} terms) to {bm25.save(pdir)}")
+    build_policy_embeddings(records, pdir)
 
 if __name__ == "__main__":
-    build_policy_chunks("lexie/policies/gdpr/gdpr.pdf", "lexie/policies/gdpr/chunks.jsonl")
-    build_policy_chunks("lexie/policies/ai_act/ai_act.pdf", "lexie/policies/ai_act/chunks.jsonl")
\ No newline at end of file
+    # python -m lexie.build_index
+    for name in POLICIES:
+        build_policy(name)
@@ -0,0 +1,96 @@
+# lexie/cache.py — cache chiave/valore persistente (SQLite) con TTL ed eviction per dimensione
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+
+def content_key(*parts: Any) -> str:
+    """sha256 di una serializzazione JSON stabile delle parti."""
+    raw = json.dumps(parts, ensure_ascii=False, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class SQLiteCache:
+    """
+    Valori JSON indicizzati per chiave. Condivisibile tra processi (WAL).
+      - ttl_s: le voci più vecchie sono ignorate e rimosse alla lettura
+      - max_entries: oltre la soglia si eliminano le meno usate di recente
+    """
+
+    def __init__(self, path, ttl_s: Optional[float] = None, max_entries: Optional[int] = None):
+        self.path = Path(path)
+        self.ttl_s = ttl_s
+        self.max_entries = max_entries
+        self.hits = self.misses = self.evictions = 0
+        self._lock = threading.Lock()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._db = sqlite3.connect(str(self.path), timeout=30, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            " key TEXT PRIMARY KEY, value TEXT NOT NULL, created REAL NOT NULL, accessed REAL NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS entries_accessed ON entries(accessed)")
+
+    def get(self, key: str) -> Any:
+        now = time.time()
+        with self._lock:
+            row = self._db.execute("SELECT value, created FROM entries WHERE key=?", (key,)).fetchone()
+            if row is not None and self.ttl_s is not None and now - row[1] > self.ttl_s:
+                self._db.execute("DELETE FROM entries WHERE key=?", (key,))
+                row = None
+            if row is None:
+                self.misses += 1
+                return None
+            self._db.execute("UPDATE entries SET accessed=? WHERE key=?", (now, key))
+            self.hits += 1
+        return json.loads(row[0])
+
+    def set(self, key: str, value: Any) -> None:
+        now = time.time()
+        raw = json.dumps(value, ensure_ascii=False)
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO entries(key, value, created, accessed) VALUES (?,?,?,?)",
+                (key, raw, now, now),
+            )
+            self._evict()
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._db.execute("DELETE FROM entries WHERE key=?", (key,))
+
+    def _evict(self):
+        if self.ttl_s is not None:
+            self._db.execute("DELETE FROM entries WHERE created < ?", (time.time() - self.ttl_s,))
+        if self.max_entries:
+            n = self._db.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+            extra = n - self.max_entries
+            if extra > 0:
+                self._db.execute(
+                    "DELETE FROM entries WHERE key IN (SELECT key FROM entries ORDER BY accessed LIMIT ?)",
+                    (extra,),
+                )
+                self.evictions += extra
+
+    def clear(self) -> None:
+        with self._lock:
+            self._db.execute("DELETE FROM entries")
+            self.hits = self.misses = self.evictions = 0
+
+    def __len__(self):
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {"path": str(self.path), "size": len(self), "hits": self.hits, "misses": self.misses,
+                "evictions": self.evictions, "hit_rate": round(self.hits / total, 4) if total else 0.0}
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
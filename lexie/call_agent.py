@@ -1,11 +1,45 @@
 # call_agent.py
-import json, time, uuid
-from .config import TOP_K, POLICIES, LOG_DIR, OUTPUT_DIR, level_from_score
+import asyncio, json, time, uuid, hashlib, unicodedata
+from concurrent.futures import ThreadPoolExecutor
+from .config import (TOP_K, POLICIES, LOG_DIR, OUTPUT_DIR, CACHE_DIR, MODEL_ID, DOC_READ_STRATEGY, level_from_score,
+                     RESULT_CACHE_ENABLED, RESULT_CACHE_TTL_S, RESULT_CACHE_MAX_ENTRIES, ASYNC_CPU_WORKERS)
 from .tools.analyze_document import handle as analyze_document
 from .tools.analyze_free_text import handle as analyze_free_text
+from .tools import analyze_document as _doc, analyze_free_text as _free
+from .legal_analyzer_gpt import alegal_analyze_with_gpt
 from .pdf_reporter import generate_report
+from .reports import submit_report
+from .retriever import index_version
+from .cache import SQLiteCache, content_key
 
-def route(payload: dict, generate_pdf: bool = False) -> dict:
+RESULT_CACHE_VERSION = 1  # da incrementare quando cambia la logica di analisi/merge
+
+_RESULT_CACHE = None
+
+def get_result_cache() -> SQLiteCache:
+    global _RESULT_CACHE
+    if _RESULT_CACHE is None:
+        _RESULT_CACHE = SQLiteCache(CACHE_DIR / "results.sqlite", RESULT_CACHE_TTL_S, RESULT_CACHE_MAX_ENTRIES)
+    return _RESULT_CACHE
+
+def _fingerprint(mode: str, payload: dict) -> str:
+    h = hashlib.sha256()
+    if mode == "document":
+        with open(payload["document_path"], "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                h.update(block)
+    else:
+        text = unicodedata.normalize("NFC", payload.get("user_text") or "")
+        h.update(" ".join(text.split()).encode("utf-8"))
+    return h.hexdigest()
+
+def result_cache_key(mode: str, payload: dict, policies, top_k: int) -> str:
+    model = payload.get("model") or MODEL_ID
+    strategy = (payload.get("read_strategy") or DOC_READ_STRATEGY) if mode == "document" else None
+    return content_key("result", RESULT_CACHE_VERSION, mode, _fingerprint(mode, payload),
+                       sorted(policies), top_k, model, strategy, index_version(policies))
+
+def _validate(payload: dict):
     mode = (payload.get("mode") or "").lower()
     if mode not in {"document", "free_text"}:
         raise ValueError("payload.mode must be 'document' or 'free_text'")
@@ -16,29 +50,94 @@ def route(payload: dict, generate_pdf: bool = False) -> dict:
     if mode == "document":
         if not payload.get("document_path"):
             raise ValueError("document mode requires payload.document_path")
-        result = analyze_document(payload)
-        if not isinstance(result, dict):
-            raise RuntimeError("analyze_document returned non-dict/None")
     else:
         if not payload.get("user_text"):
             raise ValueError("free_text mode requires payload.user_text")
-        result = analyze_free_text(payload)
-        if not isinstance(result, dict):
-            raise RuntimeError("analyze_free_text returned non-dict/None")
+    return mode, policies, top_k
 
+def _cache_lookup(payload: dict, mode: str, policies, top_k: int):
+    # documento/testo già analizzato con gli stessi indici e modello → niente parsing, retrieval, LLM
+    if not RESULT_CACHE_ENABLED or payload.get("no_cache"):
+        return None, None
+    key = result_cache_key(mode, payload, policies, top_k)
+    return key, get_result_cache().get(key)
+
+def _scored(result, mode: str, key) -> dict:
+    if not isinstance(result, dict):
+        raise RuntimeError(f"analyze_{mode} returned non-dict/None")
     score = int(result.get("risk_score", 0))
     result["risk_level"] = level_from_score(score)
+    # i risultati parziali (una legge non analizzata) non si memorizzano
+    if key and not (result.get("meta") or {}).get("partial"):
+        get_result_cache().set(key, result)
+    return result
 
+def _finish(result: dict, mode: str, policies, top_k: int, cached: bool, generate_pdf: bool,
+            background_pdf: bool = False) -> dict:
     ts = time.strftime("%Y%m%d-%H%M%S")
     result.setdefault("_meta", {"timestamp": ts, "mode": mode, "policies": policies, "top_k": top_k})
+    if cached:
+        result["_meta"]["cached"] = True
 
     log_path = LOG_DIR / f"lexie_{ts}_{uuid.uuid4().hex[:6]}.json"
     with open(log_path, "w", encoding="utf-8") as f:
         json.dump(result, f, ensure_ascii=False, indent=2)
 
     if generate_pdf:
-        out_path = OUTPUT_DIR / f"report_{ts}.pdf"
-        generate_report(result, str(out_path))
-        result["_meta"]["pdf"] = str(out_path)
+        out_path = OUTPUT_DIR / f"report_{ts}_{uuid.uuid4().hex[:6]}.pdf"
+        if background_pdf:
+            # il JSON torna subito: il PDF compare a out_path a rendering finito (reports.get_report per lo stato)
+            job = submit_report(result, out_path)
+            result["_meta"].update({"pdf": str(out_path), "pdf_job": job.id})
+        else:
+            generate_report(result, str(out_path))
+            result["_meta"]["pdf"] = str(out_path)
 
     return result
+
+def route(payload: dict, generate_pdf: bool = False, background_pdf: bool = False) -> dict:
+    mode, policies, top_k = _validate(payload)
+    key, result = _cache_lookup(payload, mode, policies, top_k)
+    cached = result is not None
+
+    if not cached:
+        if mode == "document":
+            result = _scored(analyze_document(payload), "document", key)
+        else:
+            result = _scored(analyze_free_text(payload), "free_text", key)
+
+    return _finish(result, mode, policies, top_k, cached, generate_pdf, background_pdf)
+
+# -----------------------------
+# Percorso asyncio
+# -----------------------------
+# fasi CPU/bloccanti di aroute (pdfminer, embedding, merge, log, reportlab): fuori dall'event loop
+_CPU_POOL = ThreadPoolExecutor(max_workers=max(1, ASYNC_CPU_WORKERS), thread_name_prefix="lexie-cpu")
+
+async def aroute(payload: dict, generate_pdf: bool = False, background_pdf: bool = False) -> dict:
+    """
+    route() per server asyncio: stesso risultato, ma le chiamate LLM sono attese nel loop
+    (AsyncOpenAI, limitate da LEXIE_LLM_CONCURRENCY) e le fasi CPU girano su _CPU_POOL.
+    Un solo processo serve molte analisi concorrenti senza un thread per richiesta.
+    """
+    mode, policies, top_k = _validate(payload)
+    loop = asyncio.get_running_loop()
+
+    def cpu(fn, *args):
+        return loop.run_in_executor(_CPU_POOL, fn, *args)
+
+    key, result = await cpu(_cache_lookup, payload, mode, policies, top_k)
+    cached = result is not None
+
+    if not cached:
+        if mode == "document":
+            prep = await cpu(_doc.prepare, payload)
+            raw_gdpr, raw_ai, errors = await _doc.aanalyze(prep)
+            result = await cpu(_doc.merge, prep, raw_gdpr, raw_ai, errors)
+        else:
+            prep = await cpu(_free.prepare, payload)
+            raw = await alegal_analyze_with_gpt(prep["prompt"], prep["chunks"], temperature=0.0, seed=42)
+            result = await cpu(_free.finish, prep, raw)
+        result = await cpu(_scored, result, mode, key)
+
+    return await cpu(_finish, result, mode, policies, top_k, cached, generate_pdf, background_pdf)
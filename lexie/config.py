@@ -5,24 +5,85 @@ BASE_DIR = Path(__file__).resolve().parent
 
 # Modello LLM
 MODEL_ID = os.getenv("LEXIE_GPT_MODEL", "gpt-4o-mini")
+LLM_TIMEOUT = float(os.getenv("LEXIE_LLM_TIMEOUT", "90"))  # secondi, per legge (analisi in parallelo)
+# conteggio token: auto (BPE tiktoken, fallback euristico) | heuristic (4 caratteri/token)
+TOKENIZER = os.getenv("LEXIE_TOKENIZER", "auto")
+TOKENIZER_ENCODING = os.getenv("LEXIE_TOKENIZER_ENCODING") or None  # default: encoding del modello
+PROMPT_MAX_TOKENS = int(os.getenv("LEXIE_PROMPT_MAX_TOKENS", "10000"))  # system + policy + LAW_SNIPPETS (0 = nessun limite)
+# client OpenAI condiviso: keep-alive, retry con backoff, timeout per chiamata
+LLM_BASE_URL = os.getenv("LEXIE_OPENAI_BASE_URL") or None  # es. stub locale compatibile OpenAI
+LLM_MAX_CONNECTIONS = int(os.getenv("LEXIE_LLM_MAX_CONNECTIONS", "16"))
+LLM_KEEPALIVE_S = float(os.getenv("LEXIE_LLM_KEEPALIVE", "60"))
+LLM_REQUEST_TIMEOUT = float(os.getenv("LEXIE_LLM_REQUEST_TIMEOUT", "60"))
+LLM_MAX_RETRIES = int(os.getenv("LEXIE_LLM_MAX_RETRIES", "3"))
+LLM_BACKOFF_BASE = float(os.getenv("LEXIE_LLM_BACKOFF_BASE", "0.5"))
+LLM_BACKOFF_MAX = 8.0
+# aroute (asyncio): chiamate LLM in volo per event loop (non copre route/batch/server, che usano thread)
+# e thread per le fasi CPU (PDF, embedding, report)
+LLM_ASYNC_CONCURRENCY = int(os.getenv("LEXIE_LLM_CONCURRENCY", "16"))
+ASYNC_CPU_WORKERS = int(os.getenv("LEXIE_ASYNC_CPU_WORKERS", str(os.cpu_count() or 1)))
+# cache delle risposte (solo analisi deterministiche, temperature=0): LEXIE_LLM_CACHE=0 la disattiva
+LLM_CACHE_ENABLED = os.getenv("LEXIE_LLM_CACHE", "1") != "0"
+LLM_CACHE_TTL_S = float(os.getenv("LEXIE_LLM_CACHE_TTL", str(30 * 24 * 3600)))
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("LEXIE_LLM_CACHE_MAX_ENTRIES", "5000"))
+# cache dell'intera pipeline (fingerprint documento/testo + versione indici + modello + top_k)
+RESULT_CACHE_ENABLED = os.getenv("LEXIE_RESULT_CACHE", "1") != "0"
+RESULT_CACHE_TTL_S = float(os.getenv("LEXIE_RESULT_CACHE_TTL", str(30 * 24 * 3600)))
+RESULT_CACHE_MAX_ENTRIES = int(os.getenv("LEXIE_RESULT_CACHE_MAX_ENTRIES", "2000"))
 
 # Retrieval
 TOP_K = int(os.getenv("LEXIE_TOP_K", "10"))
 MAX_EVIDENCE_CHARS = int(os.getenv("LEXIE_MAX_EVIDENCE_CHARS", "1000"))
 POLICIES = ["gdpr", "ai_act"]
+EMBED_MODEL = os.getenv("LEXIE_EMBED_MODEL", "all-MiniLM-L6-v2")
+# dense | lexical | hybrid (BM25 → rerank dense dei soli candidati, fusione RRF; opt-in finché non valutato)
+RETRIEVAL_MODE = os.getenv("LEXIE_RETRIEVAL_MODE", "dense")
+HYBRID_CANDIDATES = int(os.getenv("LEXIE_HYBRID_CANDIDATES", "50"))
+RRF_K = 60
+# ANN per corpus grandi: exact | ivf (nprobe = manopola recall/latency; sotto la soglia ricerca esatta)
+ANN_INDEX = os.getenv("LEXIE_ANN", "exact")
+ANN_NPROBE = int(os.getenv("LEXIE_ANN_NPROBE", "8"))
+ANN_MIN_CHUNKS = int(os.getenv("LEXIE_ANN_MIN_CHUNKS", "2000"))
+# cache LRU degli embedding delle query (file .npz opzionale per persisterla tra i restart)
+QUERY_CACHE_SIZE = int(os.getenv("LEXIE_QUERY_CACHE_SIZE", "1024"))
+QUERY_CACHE_PATH = os.getenv("LEXIE_QUERY_CACHE_PATH") or None
+INDEX_EMB_DTYPE = os.getenv("LEXIE_INDEX_DTYPE", "float32")  # float16 dimezza disco/RAM condivisa
 
 CHUNK_MAX_TOKENS = 350
 CHUNK_OVERLAP_TOKENS = 60
 CHUNK_MIN_TOKENS = 200
 USER_TEXT_CAP = 16000
+# estrazione PDF: 1 = seriale (default); >1 range di pagine su un pool di processi spawn (0 = tutti i core)
+PDF_WORKERS = int(os.getenv("LEXIE_PDF_WORKERS", "1"))
+PDF_PARALLEL_MIN_PAGES = int(os.getenv("LEXIE_PDF_PARALLEL_MIN_PAGES", "24"))
+# documenti lunghi: quali parti leggere entro USER_TEXT_CAP (first_n | signal_dense | spread)
+DOC_READ_STRATEGY = os.getenv("LEXIE_DOC_STRATEGY", "first_n")
+DOC_SCAN_CAP = int(os.getenv("LEXIE_DOC_SCAN_CAP", "64000"))  # caratteri esaminati da signal_dense
+# batch (python -m lexie.batch): processi per prepare (0 = in-process) e documenti in analisi LLM insieme
+BATCH_WORKERS = int(os.getenv("LEXIE_BATCH_WORKERS", str(min(4, os.cpu_count() or 1))))
+BATCH_LLM_CONCURRENCY = int(os.getenv("LEXIE_BATCH_LLM_CONCURRENCY", "4"))
+# server locale (python -m lexie.server): worker di analisi, coda limitata (429 oltre), attesa per richiesta
+SERVER_HOST = os.getenv("LEXIE_SERVER_HOST", "127.0.0.1")
+SERVER_PORT = int(os.getenv("LEXIE_SERVER_PORT", "8765"))
+SERVER_WORKERS = int(os.getenv("LEXIE_SERVER_WORKERS", "4"))
+SERVER_QUEUE_SIZE = int(os.getenv("LEXIE_SERVER_QUEUE", "32"))
+SERVER_WAIT_S = float(os.getenv("LEXIE_SERVER_WAIT", "300"))  # oltre: 202 + job id da interrogare
+SERVER_MAX_UPLOAD_MB = 10
+# report PDF in background (route(..., background_pdf=True)): processi di rendering (0 = thread in-process)
+REPORT_WORKERS = int(os.getenv("LEXIE_REPORT_WORKERS", "2"))
 RETRIEVAL_BALANCE = {"gdpr": 0.5, "ai_act": 0.5}
 STRICT_GDPR_PROMPT = True
 
 # Runtime
 OUTPUT_DIR = BASE_DIR / "runtime" / "outputs"
 LOG_DIR = BASE_DIR / "runtime" / "logs"
+CACHE_DIR = BASE_DIR / "runtime" / "cache"
+UPLOAD_DIR = BASE_DIR / "runtime" / "uploads"
+# server: {"document_path": ...} in JSON solo sotto questa cartella (altri file vanno caricati come PDF)
+SERVER_DOCUMENT_DIR = Path(os.getenv("LEXIE_SERVER_DOCUMENT_DIR", str(BASE_DIR / "runtime" / "documents")))
 OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
 LOG_DIR.mkdir(parents=True, exist_ok=True)
+CACHE_DIR.mkdir(parents=True, exist_ok=True)
 
 def level_from_score(x: int) -> str:
     try:
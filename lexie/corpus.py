@@ -0,0 +1,248 @@
+# lexie/corpus.py — registry di processo per i corpus delle policy
+import hashlib
+import json
+import mmap
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, List
+import numpy as np
+
+POLICY_DIR = Path(__file__).parent / "policies"
+
+# file che, se cambiano su disco (mtime/size), forzano il reload della policy
+WATCHED_FILES = ["chunks.jsonl", "index.yml", "embeddings.npy", "embeddings.json",
+                 "text.bin", "offsets.npy", "index.json", "bm25.npz", "ivf.npz"]
+
+# indice compatto (build_index): aperto via mmap e condiviso tra worker tramite page cache
+TEXT_BLOB = "text.bin"
+TEXT_OFFSETS = "offsets.npy"
+TEXT_MANIFEST = "index.json"
+
+
+def read_chunks_jsonl(path: Path, policy_name: str) -> List[Dict[str, Any]]:
+    out = []
+    with path.open("r", encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            raw = json.loads(line)
+            page = raw.get("page") or raw.get("page_num") or raw.get("p")
+            try:
+                page = int(page) if page is not None else None
+            except Exception:
+                page = None
+            out.append({
+                "id":   raw.get("id") or f"{policy_name}:{page if page is not None else '?'}",
+                "text": raw.get("text") or raw.get("chunk") or "",
+                "page": page,
+                "source": policy_name,
+            })
+    return out
+
+
+def replace_file(path: Path, write: Callable[[Any], None]) -> Path:
+    """
+    write(f) su un file temporaneo nella stessa cartella, poi os.replace. Mai riscrivere un indice
+    sul posto: i worker in esecuzione lo tengono in mmap e leggerebbero il nuovo contenuto (o SIGBUS
+    se il file si accorcia); con il rename continuano a vedere il vecchio inode fino al reload.
+    """
+    path = Path(path)
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    try:
+        with tmp.open("wb") as f:
+            write(f)
+        os.replace(tmp, path)
+    finally:
+        tmp.unlink(missing_ok=True)
+    return path
+
+
+def write_text_index(records: List[Dict[str, Any]], directory: Path) -> None:
+    """Formato compatto: blob UTF-8 unico + tabella offset + manifest id/pagine (per ultimo)."""
+    directory = Path(directory)
+    blobs = [(r.get("text") or "").encode("utf-8") for r in records]
+    offsets = np.zeros(len(blobs) + 1, dtype=np.int64)
+    if blobs:
+        offsets[1:] = np.cumsum([len(b) for b in blobs])
+    replace_file(directory / TEXT_BLOB, lambda f: f.write(b"".join(blobs)))
+    replace_file(directory / TEXT_OFFSETS, lambda f: np.save(f, offsets))
+    src = directory / "chunks.jsonl"
+    manifest = {
+        "count": len(records),
+        "ids": [r["id"] for r in records],
+        "pages": [r.get("page") for r in records],
+        "source_sha1": file_sha1(src) if src.exists() else None,
+    }
+    replace_file(directory / TEXT_MANIFEST, lambda f: f.write(json.dumps(manifest).encode("utf-8")))
+
+def file_sha1(path: Path) -> str:
+    h = hashlib.sha1()
+    with path.open("rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+class _MappedTexts:
+    """Testi dei chunk letti da un blob mmap: si decodifica solo ciò che serve."""
+
+    def __init__(self, blob_path: Path, offsets_path: Path):
+        self.offsets = np.load(offsets_path, mmap_mode="r")
+        with blob_path.open("rb") as f:
+            size = os.fstat(f.fileno()).st_size
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if size else b""
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i: int) -> str:
+        a, b = int(self.offsets[i]), int(self.offsets[i + 1])
+        return self._mm[a:b].decode("utf-8")
+
+
+class PolicyCorpus:
+    """Chunk di una policy (mmap se esiste l'indice compatto) + strutture derivate."""
+
+    def __init__(self, name: str, directory: Path, signature: tuple):
+        self.name = name
+        self.directory = directory
+        self.signature = signature
+        self.loaded_at = time.time()
+        self.mapped = False
+        self._derived: Dict[str, Any] = {}
+        self._lock = threading.RLock()  # le factory di memo possono richiamare memo
+
+        if not self._open_mapped():
+            path = directory / "chunks.jsonl"
+            if path.exists():
+                chunks = read_chunks_jsonl(path, name)
+            else:
+                print(f"❌ File not found: {path}")
+                chunks = []
+            self.ids = [c["id"] for c in chunks]
+            self.pages = [c["page"] for c in chunks]
+            self._texts = [c["text"] for c in chunks]
+            self._derived["chunks"] = chunks
+
+    def _open_mapped(self) -> bool:
+        d = self.directory
+        if not all((d / f).exists() for f in (TEXT_BLOB, TEXT_OFFSETS, TEXT_MANIFEST)):
+            return False
+        try:
+            manifest = json.loads((d / TEXT_MANIFEST).read_text(encoding="utf-8"))
+            digest = self.source_sha1()
+            if digest is not None and manifest.get("source_sha1") != digest:
+                print(f"⚠️ Compact index for {self.name} is stale: run `python -m lexie.build_index`")
+                return False
+            texts = _MappedTexts(d / TEXT_BLOB, d / TEXT_OFFSETS)
+            if len(texts) != len(manifest.get("ids") or []):
+                return False
+        except Exception as e:
+            print(f"⚠️ Invalid compact index for {self.name}: {e}")
+            return False
+        self.ids = list(manifest["ids"])
+        self.pages = list(manifest.get("pages") or [None] * len(self.ids))
+        self._texts = texts
+        self.mapped = True
+        return True
+
+    def __len__(self):
+        return len(self.ids)
+
+    def source_sha1(self):
+        """sha1 di chunks.jsonl (None se assente): lega gli indici su disco a questa versione."""
+        src = self.directory / "chunks.jsonl"
+        return self.memo("source_sha1", lambda c: file_sha1(src) if src.exists() else None)
+
+    def text(self, i: int) -> str:
+        return self._texts[i]
+
+    def chunk(self, i: int) -> Dict[str, Any]:
+        return {"id": self.ids[i], "text": self._texts[i], "page": self.pages[i], "source": self.name}
+
+    @property
+    def chunks(self) -> List[Dict[str, Any]]:
+        """Tutti i chunk materializzati (solo per i percorsi che scandiscono il testo intero)."""
+        return self.memo("chunks", lambda c: [c.chunk(i) for i in range(len(c))])
+
+    def memo(self, key: str, factory: Callable[["PolicyCorpus"], Any]) -> Any:
+        """Calcola una struttura derivata una sola volta per versione del corpus."""
+        try:
+            return self._derived[key]
+        except KeyError:
+            pass
+        with self._lock:
+            if key not in self._derived:
+                self._derived[key] = factory(self)
+            return self._derived[key]
+
+
+class CorpusRegistry:
+    def __init__(self):
+        self._items: Dict[tuple, PolicyCorpus] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.reloads = 0
+
+    @staticmethod
+    def signature(directory: Path) -> tuple:
+        sig = []
+        for fname in WATCHED_FILES:
+            try:
+                st = (directory / fname).stat()
+                sig.append((fname, st.st_mtime_ns, st.st_size))
+            except OSError:
+                sig.append((fname, None, None))
+        return tuple(sig)
+
+    def get(self, name: str, policy_dir: Path = None) -> PolicyCorpus:
+        directory = Path(policy_dir or POLICY_DIR) / name
+        key = (str(directory), name)
+        sig = self.signature(directory)
+        with self._lock:
+            cur = self._items.get(key)
+            if cur is not None and cur.signature == sig:
+                self.hits += 1
+                return cur
+            if cur is None:
+                self.misses += 1
+            else:
+                self.reloads += 1
+            cur = PolicyCorpus(name, directory, sig)
+            self._items[key] = cur
+            return cur
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+            self.hits = self.misses = self.reloads = 0
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            total = self.hits + self.misses + self.reloads
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "reloads": self.reloads,
+                "hit_rate": round(self.hits / total, 4) if total else 0.0,
+                "policies": {
+                    c.name: {"dir": str(c.directory), "chunks": len(c), "mapped": c.mapped,
+                             "loaded_at": c.loaded_at}
+                    for c in self._items.values()
+                },
+            }
+
+
+_REGISTRY = CorpusRegistry()
+
+def get_corpus(name: str, policy_dir: Path = None) -> PolicyCorpus:
+    return _REGISTRY.get(name, policy_dir)
+
+def corpus_stats() -> Dict[str, Any]:
+    return _REGISTRY.stats()
+
+def clear_corpus_cache():
+    _REGISTRY.clear()
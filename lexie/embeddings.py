@@ -0,0 +1,170 @@
+# lexie/embeddings.py — modello di embedding caricato una sola volta, al primo uso
+import atexit
+import hashlib
+import os
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, List
+import numpy as np
+from .config import EMBED_MODEL, QUERY_CACHE_SIZE, QUERY_CACHE_PATH
+
+_LOCK = threading.Lock()
+_model = None
+_loaded = False     # True anche se sentence-transformers manca (nessun nuovo tentativo)
+_info: Dict[str, Any] = {"model": EMBED_MODEL, "available": None, "loaded": False,
+                         "load_seconds": None, "rss_delta_mb": None, "error": None}
+
+def _rss_mb():
+    """RSS corrente del processo in MB (None se non misurabile su questa piattaforma)."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except Exception:
+        pass
+    try:
+        import resource, sys
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / 2**20 if sys.platform == "darwin" else peak / 2**10
+    except Exception:
+        return None
+
+def _load():
+    global _model, _loaded
+    rss0, t0 = _rss_mb(), time.perf_counter()
+    try:
+        from sentence_transformers import SentenceTransformer
+        _model = SentenceTransformer(EMBED_MODEL)
+        _info["available"] = True
+    except Exception as e:
+        # opzionale: senza modello il retriever usa il fallback lessicale
+        _model = None
+        _info.update(available=False, error=f"{type(e).__name__}: {e}")
+    rss1 = _rss_mb()
+    _info.update(
+        loaded=_model is not None,
+        load_seconds=round(time.perf_counter() - t0, 3),
+        rss_delta_mb=round(rss1 - rss0, 1) if rss0 is not None and rss1 is not None else None,
+    )
+    _loaded = True
+
+def get_model():
+    """SentenceTransformer condiviso (None se non disponibile); il primo chiamante paga il caricamento."""
+    if not _loaded:
+        with _LOCK:
+            if not _loaded:
+                _load()
+    return _model
+
+def model_info() -> Dict[str, Any]:
+    return dict(_info)
+
+def warmup() -> Dict[str, Any]:
+    """Carica il modello ed esegue un encode di prova (per la startup probe del server)."""
+    model = get_model()
+    if model is not None:
+        t0 = time.perf_counter()
+        encode_texts(["warm-up"])
+        _info["warmup_encode_seconds"] = round(time.perf_counter() - t0, 3)
+    return model_info()
+
+def encode_texts(texts) -> np.ndarray:
+    """Embedding float32 L2-normalizzati, una riga per testo (un solo encode batch)."""
+    texts = list(texts)
+    vecs = get_model().encode(texts, batch_size=64, convert_to_numpy=True, show_progress_bar=False)
+    vecs = np.asarray(vecs, dtype=np.float32).reshape(len(texts), -1)
+    return vecs / (np.linalg.norm(vecs, axis=1, keepdims=True) + 1e-9)
+
+
+class QueryCache:
+    """LRU limitato: hash(modello + testo normalizzato) → vettore della query."""
+
+    def __init__(self, max_items: int = 1024, path: str = None):
+        self.max_items = max(0, int(max_items))
+        self.path = Path(path) if path else None
+        self._data: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.evictions = 0
+        if self.path and self.path.exists():
+            self.load()
+
+    @staticmethod
+    def key(text: str) -> str:
+        norm = " ".join(unicodedata.normalize("NFC", text or "").split())
+        return hashlib.sha1(f"{EMBED_MODEL}\0{norm}".encode("utf-8")).hexdigest()
+
+    def get(self, key: str):
+        with self._lock:
+            vec = self._data.get(key)
+            if vec is None:
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return vec
+
+    def put(self, key: str, vec: np.ndarray):
+        if not self.max_items:
+            return
+        vec = np.array(vec, dtype=np.float32)
+        vec.setflags(write=False)
+        with self._lock:
+            self._data[key] = vec
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_items:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.hits = self.misses = self.evictions = 0
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            total = self.hits + self.misses
+            return {"size": len(self._data), "max_items": self.max_items, "hits": self.hits,
+                    "misses": self.misses, "evictions": self.evictions,
+                    "hit_rate": round(self.hits / total, 4) if total else 0.0}
+
+    def save(self):
+        if not self.path or not self._data:
+            return
+        with self._lock:
+            keys = list(self._data)
+            mat = np.stack([self._data[k] for k in keys])
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_name(self.path.name + ".tmp.npz")
+        np.savez(tmp, keys=np.array(keys, dtype=str), vecs=mat)
+        os.replace(tmp, self.path)
+
+    def load(self):
+        try:
+            with np.load(self.path, allow_pickle=False) as z:
+                for k, v in zip(z["keys"].tolist(), z["vecs"]):
+                    self.put(k, v)
+        except Exception as e:
+            print(f"⚠️ Query cache not loaded ({self.path}): {e}")
+
+
+QUERY_CACHE = QueryCache(QUERY_CACHE_SIZE, QUERY_CACHE_PATH)
+if QUERY_CACHE.path:
+    atexit.register(QUERY_CACHE.save)
+
+def encode_queries(texts: List[str]) -> np.ndarray:
+    """Come encode_texts, ma passando dalla cache LRU: si codificano (in un batch) solo i miss."""
+    texts = list(texts)
+    keys = [QUERY_CACHE.key(t) for t in texts]
+    vecs = [QUERY_CACHE.get(k) for k in keys]
+    miss = [i for i, v in enumerate(vecs) if v is None]
+    if miss:
+        fresh = encode_texts([texts[i] for i in miss])
+        for i, v in zip(miss, fresh):
+            QUERY_CACHE.put(keys[i], v)
+            vecs[i] = v
+    return np.stack(vecs).astype(np.float32, copy=False) if vecs else np.empty((0, 0), dtype=np.float32)
+
+def query_cache_stats() -> Dict[str, Any]:
+    return QUERY_CACHE.stats()
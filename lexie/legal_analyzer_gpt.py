@@ -1,11 +1,28 @@
 import os
 import json
+import asyncio
+import random
+import threading
+import time
+import weakref
 from typing import List, Dict
+from .config import (LLM_BASE_URL, LLM_MAX_CONNECTIONS, LLM_KEEPALIVE_S, LLM_REQUEST_TIMEOUT,
+                     LLM_MAX_RETRIES, LLM_BACKOFF_BASE, LLM_BACKOFF_MAX,
+                     LLM_CACHE_ENABLED, LLM_CACHE_TTL_S, LLM_CACHE_MAX_ENTRIES, CACHE_DIR, PROMPT_MAX_TOKENS,
+                     LLM_ASYNC_CONCURRENCY)
+from .cache import SQLiteCache, content_key
+from .tokens import count_tokens, truncate_tokens
 
 try:
-    from openai import OpenAI
+    import openai
+    from openai import OpenAI, AsyncOpenAI
+    # errori transitori: si ritenta con backoff; gli altri (auth, 4xx) salgono subito
+    _RETRYABLE = (openai.APIConnectionError, openai.APITimeoutError,
+                  openai.RateLimitError, openai.InternalServerError)
 except Exception:
     OpenAI = None
+    AsyncOpenAI = None
+    _RETRYABLE = ()
 
 DEFAULT_MODEL = os.getenv("LEXIE_GPT_MODEL", "gpt-4o-mini")
 
@@ -32,7 +49,7 @@ def _format_evidence(evidences: List[Dict]) -> str:
         items.append({"id": cid, "page": page, "source": src, "excerpt": txt[:1200]})
     return json.dumps(items, ensure_ascii=False)
 
-def build_prompt(user_text: str, evidences: List[Dict]) -> str:
+def _render_prompt(user_text: str, snippets: str) -> str:
     return f'''
 Evaluate the following POLICY TEXT against BOTH GDPR and AI Act using the LAW_SNIPPETS provided.
 
@@ -74,30 +91,168 @@ POLICY TEXT:
 {user_text}
 
 LAW_SNIPPETS (JSON array of objects: id, page, source, excerpt):
-{_format_evidence(evidences)}
+{snippets}
 '''
 
-def legal_analyze_with_gpt(prompt: str, evidences: List[Dict], model: str = None, temperature: float = 0.0, seed: int = 42) -> Dict:
-    model = model or DEFAULT_MODEL
-    if OpenAI is None:
-        raise RuntimeError("OpenAI library not available. Run: pip install openai")
+def fit_prompt_budget(user_text: str, evidences: List[Dict], max_tokens: int):
+    """
+    SYSTEM_MSG + prompt entro max_tokens. Gli snippet (già ordinati per rilevanza) hanno la precedenza,
+    ma POLICY TEXT conserva almeno metà dello spazio residuo: oltre si scartano gli snippet in coda;
+    infine si tronca POLICY TEXT al confine di token.
+    """
+    fixed = count_tokens(SYSTEM_MSG) + count_tokens(_render_prompt("", "[]")) + 8  # margine di giunzione
+    room = max(0, max_tokens - fixed)
+    policy_floor = min(count_tokens(user_text), room // 2)
+    evs = list(evidences)
+    while evs and count_tokens(_format_evidence(evs)) > room - policy_floor:
+        evs.pop()
+    user_room = room - (count_tokens(_format_evidence(evs)) if evs else 0)
+    if count_tokens(user_text) > user_room:
+        user_text = truncate_tokens(user_text, user_room)
+    return user_text, evs
+
+def build_prompt(user_text: str, evidences: List[Dict], max_tokens: int = None) -> str:
+    budget = PROMPT_MAX_TOKENS if max_tokens is None else max_tokens
+    if budget:
+        user_text, evidences = fit_prompt_budget(user_text, evidences, budget)
+    return _render_prompt(user_text, _format_evidence(evidences))
+
+# -----------------------------
+# Client condiviso (keep-alive)
+# -----------------------------
+_CLIENTS: Dict[tuple, object] = {}
+_CLIENTS_LOCK = threading.Lock()
+
+def _http_client(asynchronous: bool = False):
+    """Pool httpx con limiti espliciti; None → pool di default dell'SDK (comunque keep-alive)."""
+    try:
+        import httpx
+        from openai import DefaultHttpxClient, DefaultAsyncHttpxClient
+        cls = DefaultAsyncHttpxClient if asynchronous else DefaultHttpxClient
+        return cls(limits=httpx.Limits(
+            max_connections=LLM_MAX_CONNECTIONS,
+            max_keepalive_connections=LLM_MAX_CONNECTIONS,
+            keepalive_expiry=LLM_KEEPALIVE_S,
+        ))
+    except Exception:
+        return None
+
+def _client_kwargs(api_key: str, asynchronous: bool = False) -> Dict:
+    kw = {"api_key": api_key, "max_retries": 0}  # i retry li gestisce _create_with_retry
+    if LLM_BASE_URL:
+        kw["base_url"] = LLM_BASE_URL
+    http_client = _http_client(asynchronous)
+    if http_client is not None:
+        kw["http_client"] = http_client
+    return kw
+
+def get_client(api_key: str):
+    """Un client per (api_key, base_url) per processo: connessioni TLS/HTTP riusate tra le chiamate."""
+    key = (api_key, LLM_BASE_URL)
+    client = _CLIENTS.get(key)
+    if client is None:
+        with _CLIENTS_LOCK:
+            client = _CLIENTS.get(key)
+            if client is None:
+                client = _CLIENTS[key] = OpenAI(**_client_kwargs(api_key))
+    return client
+
+# client asincroni e limitatore: il pool httpx e il semaforo appartengono all'event loop che li usa
+_ASYNC_STATE = weakref.WeakKeyDictionary()   # loop → {"clients": {...}, "semaphore": Semaphore}
+
+def _loop_state() -> Dict:
+    loop = asyncio.get_running_loop()
+    state = _ASYNC_STATE.get(loop)
+    if state is None:
+        state = _ASYNC_STATE[loop] = {"clients": {}, "semaphore": asyncio.Semaphore(max(1, LLM_ASYNC_CONCURRENCY))}
+    return state
+
+def get_async_client(api_key: str):
+    """Come get_client, per l'event loop corrente (AsyncOpenAI)."""
+    clients = _loop_state()["clients"]
+    key = (api_key, LLM_BASE_URL)
+    if key not in clients:
+        clients[key] = AsyncOpenAI(**_client_kwargs(api_key, asynchronous=True))
+    return clients[key]
+
+def llm_semaphore() -> asyncio.Semaphore:
+    """Limite alle chiamate LLM in volo da aroute nell'event loop corrente (LEXIE_LLM_CONCURRENCY per loop)."""
+    return _loop_state()["semaphore"]
+
+def reset_clients():
+    with _CLIENTS_LOCK:
+        for c in _CLIENTS.values():
+            try:
+                c.close()
+            except Exception:
+                pass
+        _CLIENTS.clear()
+        # i client async si chiudono con il loro event loop
+        _ASYNC_STATE.clear()
+
+def _backoff(attempt: int) -> float:
+    # esponenziale con jitter (0.5–1.5×) per non sincronizzare i retry dei worker
+    return min(LLM_BACKOFF_MAX, LLM_BACKOFF_BASE * (2 ** attempt)) * random.uniform(0.5, 1.5)
+
+def _create_with_retry(client, timeout: float = None, deadline: float = None, **kw):
+    """
+    Retry con backoff sugli errori transitori. deadline (time.monotonic()) limita tutto: timeout
+    del singolo tentativo, attese e retry si fermano lì, così un thread non resta occupato oltre
+    il timeout di chi aspetta la risposta.
+    """
+    timeout = LLM_REQUEST_TIMEOUT if timeout is None else timeout
+    for attempt in range(LLM_MAX_RETRIES + 1):
+        left = timeout if deadline is None else min(timeout, deadline - time.monotonic())
+        if left <= 0:
+            raise TimeoutError("LLM deadline exceeded")
+        try:
+            return client.chat.completions.create(timeout=left, **kw)
+        except _RETRYABLE:
+            pause = _backoff(attempt)
+            if attempt >= LLM_MAX_RETRIES or (deadline is not None and time.monotonic() + pause >= deadline):
+                raise
+            time.sleep(pause)
+
+async def _acreate_with_retry(client, timeout: float = None, **kw):
+    timeout = LLM_REQUEST_TIMEOUT if timeout is None else timeout
+    for attempt in range(LLM_MAX_RETRIES + 1):
+        try:
+            return await client.chat.completions.create(timeout=timeout, **kw)
+        except _RETRYABLE:
+            if attempt >= LLM_MAX_RETRIES:
+                raise
+            await asyncio.sleep(_backoff(attempt))
+
+# -----------------------------
+# Cache risposte (content-addressed)
+# -----------------------------
+_LLM_CACHE = None
 
+def get_llm_cache() -> SQLiteCache:
+    global _LLM_CACHE
+    if _LLM_CACHE is None:
+        with _CLIENTS_LOCK:
+            if _LLM_CACHE is None:
+                _LLM_CACHE = SQLiteCache(CACHE_DIR / "llm.sqlite", LLM_CACHE_TTL_S, LLM_CACHE_MAX_ENTRIES)
+    return _LLM_CACHE
+
+def llm_cache_key(model: str, prompt: str, seed: int, temperature: float) -> str:
+    return content_key("llm/v1", model, SYSTEM_MSG, prompt, seed, temperature)
+
+def _api_key() -> str:
     api_key = os.getenv("OPENAI_API_KEY")
     if not api_key:
         raise RuntimeError("Missing OPENAI_API_KEY in environment. Set it before running.")
+    return api_key
 
-    client = OpenAI(api_key=api_key)
-
+def _messages(prompt: str) -> List[Dict]:
     # prompt è già stato costruito prima, non serve rebuild
-    resp = client.chat.completions.create(
-        model=model,
-        messages=[
-            {"role": "system", "content": SYSTEM_MSG},
-            {"role": "user", "content": prompt},
-        ],
-        temperature=temperature,
-        seed=seed,
-    )
+    return [
+        {"role": "system", "content": SYSTEM_MSG},
+        {"role": "user", "content": prompt},
+    ]
+
+def _parse_response(resp) -> Dict:
     content = resp.choices[0].message.content.strip()
 
     try:
@@ -120,5 +275,56 @@ def legal_analyze_with_gpt(prompt: str, evidences: List[Dict], model: str = None
     def level(x): 
         return "low" if x < 33 else ("medium" if x < 66 else "high")
     data["risk_level"] = level(s)
+    return data
+
+def legal_analyze_with_gpt(prompt: str, evidences: List[Dict], model: str = None, temperature: float = 0.0,
+                           seed: int = 42, use_cache: bool = None, deadline: float = None) -> Dict:
+    # deadline (time.monotonic()): oltre, niente nuovi tentativi né attese (vedi _create_with_retry)
+    model = model or DEFAULT_MODEL
+    # cache solo per chiamate deterministiche; use_cache=False la bypassa per la singola chiamata
+    cacheable = (LLM_CACHE_ENABLED if use_cache is None else use_cache) and temperature == 0
+    if cacheable:
+        key = llm_cache_key(model, prompt, seed, temperature)
+        hit = get_llm_cache().get(key)
+        if hit is not None:
+            return hit
+
+    if OpenAI is None:
+        raise RuntimeError("OpenAI library not available. Run: pip install openai")
+
+    client = get_client(_api_key())
+    resp = _create_with_retry(client, deadline=deadline, model=model, messages=_messages(prompt),
+                              temperature=temperature, seed=seed)
+    data = _parse_response(resp)
+
+    if cacheable:
+        get_llm_cache().set(key, data)
+    return data
+
+async def alegal_analyze_with_gpt(prompt: str, evidences: List[Dict], model: str = None, temperature: float = 0.0,
+                                  seed: int = 42, use_cache: bool = None, timeout: float = None) -> Dict:
+    """
+    Versione asyncio di legal_analyze_with_gpt: stessa cache e stesso parsing, richiesta HTTP attesa
+    nel loop (AsyncOpenAI) sotto llm_semaphore(). La cache SQLite si legge/scrive in un thread.
+    timeout (asyncio.TimeoutError) parte solo dopo aver ottenuto il semaforo: l'attesa in coda non conta.
+    """
+    model = model or DEFAULT_MODEL
+    cacheable = (LLM_CACHE_ENABLED if use_cache is None else use_cache) and temperature == 0
+    if cacheable:
+        key = llm_cache_key(model, prompt, seed, temperature)
+        hit = await asyncio.to_thread(get_llm_cache().get, key)
+        if hit is not None:
+            return hit
+
+    if AsyncOpenAI is None:
+        raise RuntimeError("OpenAI library not available. Run: pip install openai")
+
+    client = get_async_client(_api_key())
+    async with llm_semaphore():
+        resp = await asyncio.wait_for(_acreate_with_retry(client, model=model, messages=_messages(prompt),
+                                                          temperature=temperature, seed=seed), timeout)
+    data = _parse_response(resp)
 
+    if cacheable:
+        await asyncio.to_thread(get_llm_cache().set, key, data)
     return data
@@ -0,0 +1,101 @@
+# lexie/lexical.py — motore lessicale BM25 (nessuna dipendenza da torch)
+import re
+from collections import Counter
+from pathlib import Path
+from typing import Dict, Iterable, List
+import numpy as np
+from .corpus import replace_file
+
+BM25_FILE = "bm25.npz"
+
+_WORD = re.compile(r"\w+", re.UNICODE)
+# riferimenti normativi come token unici: "Art. 46" → "art:46", "Annex III" → "annex:iii"
+_REF = re.compile(
+    r"\b(?:(art(?:icle|icolo)?s?|artt)\.?\s*(\d+)|(annex|allegato)\s+([ivxlc]+|\d+)|(recital|considerando)\s+(\d+))\b",
+    re.I,
+)
+
+def tokenize(text: str) -> List[str]:
+    """Tokenizer condiviso da ingestion (build_index) e query."""
+    t = (text or "").lower()
+    toks = _WORD.findall(t)
+    for m in _REF.finditer(t):
+        if m.group(2):
+            toks.append(f"art:{m.group(2)}")
+        elif m.group(4):
+            toks.append(f"annex:{m.group(4)}")
+        else:
+            toks.append(f"recital:{m.group(6)}")
+    return toks
+
+
+class BM25Index:
+    """
+    Indice invertito in array piatti (CSR): per il termine t le posting sono
+    docs[ptr[t]:ptr[t+1]] con frequenze tfs[...]. Lo scoring tocca solo le posting dei termini della query.
+    """
+
+    def __init__(self, terms: List[str], ptr, docs, tfs, doc_len, k1: float = 1.5, b: float = 0.75,
+                 source_sha1: str = None):
+        self.terms = list(terms)
+        self.vocab: Dict[str, int] = {t: i for i, t in enumerate(self.terms)}
+        self.ptr = np.asarray(ptr, dtype=np.int64)
+        self.docs = np.asarray(docs, dtype=np.int32)
+        self.tfs = np.asarray(tfs, dtype=np.float32)
+        self.doc_len = np.asarray(doc_len, dtype=np.float32)
+        self.k1, self.b = float(k1), float(b)
+        self.source_sha1 = source_sha1
+        n = len(self.doc_len)
+        avgdl = float(self.doc_len.mean()) if n else 1.0
+        # parte del denominatore che dipende solo dal documento
+        self._norm = self.k1 * (1 - self.b + self.b * self.doc_len / (avgdl or 1.0))
+        df = np.diff(self.ptr).astype(np.float32)
+        self.idf = np.log1p((n - df + 0.5) / (df + 0.5)).astype(np.float32)
+
+    def __len__(self):
+        return len(self.doc_len)
+
+    @classmethod
+    def build(cls, texts: Iterable[str], k1: float = 1.5, b: float = 0.75, source_sha1: str = None) -> "BM25Index":
+        postings: Dict[str, List[tuple]] = {}
+        doc_len = []
+        for d, text in enumerate(texts):
+            counts = Counter(tokenize(text))
+            doc_len.append(sum(counts.values()))
+            for term, tf in counts.items():
+                postings.setdefault(term, []).append((d, tf))
+        terms = sorted(postings)
+        ptr = np.zeros(len(terms) + 1, dtype=np.int64)
+        docs, tfs = [], []
+        for i, term in enumerate(terms):
+            pl = postings[term]
+            ptr[i + 1] = ptr[i] + len(pl)
+            docs.extend(d for d, _ in pl)
+            tfs.extend(tf for _, tf in pl)
+        return cls(terms, ptr, docs, tfs, doc_len, k1, b, source_sha1)
+
+    def scores(self, query: str) -> np.ndarray:
+        out = np.zeros(len(self), dtype=np.float32)
+        for term in set(tokenize(query)):
+            t = self.vocab.get(term)
+            if t is None:
+                continue
+            a, z = self.ptr[t], self.ptr[t + 1]
+            d, tf = self.docs[a:z], self.tfs[a:z]
+            out[d] += self.idf[t] * tf * (self.k1 + 1) / (tf + self._norm[d])
+        return out
+
+    def save(self, directory: Path) -> Path:
+        arrays = dict(
+            terms=np.array(self.terms, dtype=str), ptr=self.ptr, docs=self.docs, tfs=self.tfs,
+            doc_len=self.doc_len, params=np.array([self.k1, self.b], dtype=np.float64),
+            source_sha1=np.array(self.source_sha1 or "", dtype=str),
+        )
+        return replace_file(Path(directory) / BM25_FILE, lambda f: np.savez(f, **arrays))
+
+    @classmethod
+    def load(cls, directory: Path) -> "BM25Index":
+        with np.load(Path(directory) / BM25_FILE, allow_pickle=False) as z:
+            k1, b = (float(x) for x in z["params"])
+            return cls(z["terms"].tolist(), z["ptr"], z["docs"], z["tfs"], z["doc_len"], k1, b,
+                       str(z["source_sha1"]) or None)
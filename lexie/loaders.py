@@ -1,5 +1,18 @@
-from pdfminer.high_level import extract_text
+import multiprocessing
+import os
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from io import StringIO
+from pdfminer.converter import TextConverter
+from pdfminer.layout import LAParams
+from pdfminer.pdfinterp import PDFPageInterpreter, PDFResourceManager
+from pdfminer.pdfdocument import PDFDocument
+from pdfminer.pdfpage import PDFPage
+from pdfminer.pdfparser import PDFParser
+from pdfminer.pdftypes import resolve1
 import re
+from .config import PDF_WORKERS, PDF_PARALLEL_MIN_PAGES
 
 _SPACES = re.compile(r"[ \t]+")
 _NEWLINES = re.compile(r"\s*\n\s*")
@@ -14,16 +27,121 @@ def _clean_text(s: str) -> str:
     s = _NEWLINES.sub("\n", s)
     return s.strip()
 
-def load_file_text(file_path):
+def _catalog_count(doc):
+    # /Count della radice dell'albero delle pagine: nessuna visita delle pagine
     try:
-        text = extract_text(file_path)
-        pages = text.split("\f")
-        out = []
-        for i, pg in enumerate(pages):
-            pg = _clean_text(pg)
+        return int(resolve1(resolve1(doc.catalog["Pages"])["Count"]))
+    except Exception:
+        return None
+
+def _iter_pages(file_path, pagenos=None, info=None):
+    # stesso layout di extract_text, ma il buffer contiene una sola pagina alla volta;
+    # pagenos (indici 0-based) limita il parsing alle pagine richieste;
+    # info (dict) riceve "pages_total" appena il documento è aperto
+    last = max(pagenos) if pagenos else None
+    with open(file_path, "rb") as fp:
+        doc = PDFDocument(PDFParser(fp))
+        if info is not None:
+            info["pages_total"] = _catalog_count(doc)
+        rsrcmgr = PDFResourceManager(caching=True)
+        buf = StringIO()
+        device = TextConverter(rsrcmgr, buf, laparams=LAParams())
+        interpreter = PDFPageInterpreter(rsrcmgr, device)
+        for i, page in enumerate(PDFPage.create_pages(doc)):
+            if last is not None and i > last:
+                break
+            if pagenos is not None and i not in pagenos:
+                continue
+            interpreter.process_page(page)
+            pg = _clean_text(buf.getvalue())
+            buf.seek(0)
+            buf.truncate()
             if pg:
-                out.append({"page": i+1, "text": pg})
-        return out
+                yield {"page": i+1, "text": pg}
+
+def _extract_range(file_path, start: int, stop: int):
+    # eseguita nei processi worker
+    return list(_iter_pages(file_path, range(start, stop)))
+
+def page_count(file_path) -> int:
+    """Numero di pagine dal catalogo (fallback: visita dell'albero delle pagine, senza analizzarne il contenuto)."""
+    with open(file_path, "rb") as fp:
+        doc = PDFDocument(PDFParser(fp))
+        n = _catalog_count(doc)
+        return n if n is not None else sum(1 for _ in PDFPage.create_pages(doc))
+
+_POOLS = {}
+_POOLS_LOCK = threading.Lock()
+
+def _get_pool(workers: int) -> ProcessPoolExecutor:
+    """
+    Pool per numero di worker, creato una volta e riusato. Start method "spawn": il processo che
+    legge ha già thread (pool LLM, server, aroute) e torch/tokenizers caricati, un fork lì può bloccarsi.
+    """
+    with _POOLS_LOCK:
+        pool = _POOLS.get(workers)
+        if pool is None:
+            pool = _POOLS[workers] = ProcessPoolExecutor(max_workers=workers,
+                                                         mp_context=multiprocessing.get_context("spawn"))
+        return pool
+
+def _pdf_pages(file_path, workers: int = None, info=None):
+    """
+    Pagine in ordine. Con più worker (LEXIE_PDF_WORKERS > 1, 0 = tutti i core) e abbastanza pagine,
+    range contigui vengono estratti da un pool di processi e riassemblati nell'ordine originale.
+    I range si inviano man mano, circa `workers` avanti a chi legge: se chi legge si ferma
+    (first_n, signal_dense) il resto del documento non viene estratto.
+    """
+    workers = PDF_WORKERS if workers is None else workers
+    if workers <= 0:
+        workers = os.cpu_count() or 1
+    n = page_count(file_path) if workers > 1 else 0
+    if workers <= 1 or n < max(2, PDF_PARALLEL_MIN_PAGES):
+        yield from _iter_pages(file_path, info=info)
+        return
+    if info is not None:
+        info["pages_total"] = n
+    # più range che processi: bilancia le pagine pesanti e limita il lavoro sprecato se chi legge si ferma
+    size = max(2, -(-n // (workers * 4)))
+    workers = min(workers, -(-n // size))
+    pool = _get_pool(workers)
+    starts = iter(range(0, n, size))
+    pending = deque()
+
+    def submit_next():
+        a = next(starts, None)
+        if a is not None:
+            pending.append(pool.submit(_extract_range, str(file_path), a, min(n, a + size)))
+
+    try:
+        for _ in range(workers):
+            submit_next()
+        while pending:
+            pages = pending.popleft().result()
+            submit_next()
+            yield from pages
+    finally:
+        for f in pending:
+            f.cancel()
+
+def iter_file_pages(file_path, workers: int = None, pages=None, info=None):
+    """
+    Generatore di pagine pulite {"page", "text"}: chi consuma può fermarsi prima della fine (close()).
+    pages: sottoinsieme di numeri di pagina (1-based) da estrarre, in ordine di documento.
+    info: dict che riceve "pages_total" (dal catalogo PDF) senza un secondo parsing del file.
+    File illeggibili o non PDF: nessuna pagina, come load_file_text.
+    """
+    try:
+        if pages is not None:
+            yield from _iter_pages(file_path, frozenset(p - 1 for p in pages), info)
+        else:
+            yield from _pdf_pages(file_path, workers, info)
+    except Exception as e:
+        print(f"❌ Failed to load PDF: {e}")
+
+def load_file_text(file_path, workers: int = None):
+    try:
+        return list(_pdf_pages(file_path, workers))
     except Exception as e:
         print(f"❌ Failed to load PDF: {e}")
         return []
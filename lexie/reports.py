@@ -0,0 +1,117 @@
+# lexie/reports.py — report PDF fuori dal percorso critico: pool di rendering, scrittura atomica, handle di stato
+import copy
+import multiprocessing
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, Optional
+from .config import OUTPUT_DIR, REPORT_WORKERS
+
+JOB_HISTORY = 512  # handle conservati per get_report()
+
+
+def render_atomic(result: Dict, out_path) -> str:
+    """generate_report su un file temporaneo nella stessa cartella, poi os.replace: il PDF compare solo completo."""
+    from .pdf_reporter import generate_report
+    out = Path(out_path)
+    out.parent.mkdir(parents=True, exist_ok=True)
+    tmp = out.with_name(f".{out.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    try:
+        generate_report(result, str(tmp))
+        os.replace(tmp, out)
+    finally:
+        tmp.unlink(missing_ok=True)
+    return str(out)
+
+
+class ReportJob:
+    """Handle di un report in rendering: status pending | running | done | error, wait() per il path."""
+
+    def __init__(self, future, path: Path):
+        self.id = uuid.uuid4().hex[:12]
+        self.path = Path(path)
+        self.future = future
+        self.submitted = time.monotonic()
+        self.seconds = None
+        future.add_done_callback(self._finished)
+
+    def _finished(self, _):
+        self.seconds = round(time.monotonic() - self.submitted, 3)
+
+    @property
+    def status(self) -> str:
+        f = self.future
+        if f.done():
+            return "error" if f.cancelled() or f.exception() is not None else "done"
+        return "running" if f.running() else "pending"
+
+    @property
+    def error(self) -> Optional[str]:
+        if self.status != "error":
+            return None
+        e = self.future.exception() if not self.future.cancelled() else None
+        return f"{type(e).__name__}: {e}" if e else "cancelled"
+
+    def wait(self, timeout: float = None) -> str:
+        """Attende il rendering; ritorna il path del PDF o solleva l'errore del worker."""
+        return self.future.result(timeout)
+
+    def to_dict(self) -> Dict:
+        out = {"job_id": self.id, "status": self.status, "path": str(self.path)}
+        if self.seconds is not None:
+            out["seconds"] = self.seconds
+        if self.status == "error":
+            out["error"] = self.error
+        return out
+
+
+_POOL = None
+_LOCK = threading.Lock()
+_JOBS: "OrderedDict[str, ReportJob]" = OrderedDict()
+
+def _pool():
+    global _POOL
+    if _POOL is None:
+        with _LOCK:
+            if _POOL is None:
+                # reportlab è Python puro: in un processo a parte il layout non contende il GIL alle richieste.
+                # spawn: il pool nasce da thread di server/_CPU_POOL con torch già caricato (fork a rischio
+                # deadlock); ai worker basta reportlab
+                if REPORT_WORKERS > 0:
+                    _POOL = ProcessPoolExecutor(max_workers=REPORT_WORKERS,
+                                                mp_context=multiprocessing.get_context("spawn"))
+                else:
+                    _POOL = ThreadPoolExecutor(max_workers=1, thread_name_prefix="lexie-report")
+    return _POOL
+
+def default_report_path() -> Path:
+    return OUTPUT_DIR / f"report_{time.strftime('%Y%m%d-%H%M%S')}_{uuid.uuid4().hex[:6]}.pdf"
+
+def submit_report(result: Dict, out_path=None) -> ReportJob:
+    """Accoda il rendering di `result` e ritorna subito l'handle (copia del risultato: il chiamante può modificarlo)."""
+    path = Path(out_path) if out_path else default_report_path()
+    job = ReportJob(_pool().submit(render_atomic, copy.deepcopy(result), str(path)), path)
+    with _LOCK:
+        _JOBS[job.id] = job
+        # si scartano solo handle conclusi: un report ancora in rendering resta interrogabile
+        while len(_JOBS) > JOB_HISTORY:
+            oldest = next(iter(_JOBS.values()))
+            if not oldest.future.done():
+                break
+            _JOBS.popitem(last=False)
+    return job
+
+def get_report(job_id: str) -> Optional[ReportJob]:
+    with _LOCK:
+        return _JOBS.get(job_id)
+
+def shutdown(wait: bool = True) -> None:
+    global _POOL
+    with _LOCK:
+        pool, _POOL = _POOL, None
+    if pool is not None:
+        pool.shutdown(wait=wait)
@@ -1,51 +1,119 @@
 # lexie/retriever.py — fallback first (no torch)
 import json
 from pathlib import Path
+from typing import Dict, List
 import numpy as np
-
-# opzionale: embeddings se disponibili, altrimenti fallback
-try:
-    from sentence_transformers import SentenceTransformer
-    _ST = SentenceTransformer("all-MiniLM-L6-v2")
-except Exception:
-    _ST = None
+from .config import (POLICIES, EMBED_MODEL, RETRIEVAL_MODE, HYBRID_CANDIDATES, RRF_K,
+                     ANN_INDEX, ANN_NPROBE, ANN_MIN_CHUNKS)
+from .corpus import get_corpus, CorpusRegistry
+from .cache import content_key
+from .lexical import BM25Index
+from .ann import IVFIndex
+# modello caricato in modo lazy al primo retrieval dense (vedi embeddings.warmup)
+from .embeddings import get_model, encode_texts, encode_queries
 
 POLICY_DIR = Path(__file__).parent / "policies"
 
+# scritti da build_index accanto a chunks.jsonl
+EMB_FILE = "embeddings.npy"
+EMB_MANIFEST = "embeddings.json"
+
 def load_chunks(policy_name: str):
-    path = POLICY_DIR / policy_name / "chunks.jsonl"
-    if not path.exists():
-        print(f"❌ File not found: {path}")
-        return []
-    out = []
-    with path.open("r", encoding="utf-8") as f:
-        for line in f:
-            if not line.strip():
-                continue
-            raw = json.loads(line)
-            page = raw.get("page") or raw.get("page_num") or raw.get("p")
-            try:
-                page = int(page) if page is not None else None
-            except Exception:
-                page = None
-            out.append({
-                "id":   raw.get("id") or f"{policy_name}:{page if page is not None else '?'}",
-                "text": raw.get("text") or raw.get("chunk") or "",
-                "page": page,
-                "source": policy_name,
-            })
-    return out
-    
-def retrieve_law_chunks(query_text: str, policy_list, top_k=8):
-    scored_by_policy = {}
-    for policy in policy_list:
-        items = []
-        for ch in load_chunks(policy):
-            s = _score(query_text, ch["text"])
-            items.append({**ch, "score": s})
-        items.sort(key=lambda x: x["score"], reverse=True)
-        scored_by_policy[policy] = items
+    # copia superficiale: i dict in cache non devono essere modificati dai chiamanti
+    return [dict(c) for c in get_corpus(policy_name, POLICY_DIR).chunks]
+
+def load_embeddings(policy_name: str, ids, directory: Path = None, source_sha1: str = None):
+    """
+    Matrice precalcolata da build_index (memmap, sola lettura); None se assente o non allineata.
+    Gli id sono posizionali: con source_sha1 (sha1 di chunks.jsonl) anche un testo modificato a
+    parità di chunk rende la matrice stale, come per BM25/IVF/indice compatto.
+    """
+    directory = Path(directory or POLICY_DIR / policy_name)
+    emb_path = directory / EMB_FILE
+    man_path = directory / EMB_MANIFEST
+    if not emb_path.exists() or not man_path.exists():
+        return None
+    try:
+        manifest = json.loads(man_path.read_text(encoding="utf-8"))
+        mat = np.load(emb_path, mmap_mode="r")
+    except Exception as e:
+        print(f"⚠️ Invalid embeddings for {policy_name}: {e}")
+        return None
+    if (manifest.get("model") != EMBED_MODEL
+            or manifest.get("ids") != list(ids)
+            or (source_sha1 is not None and manifest.get("source_sha1") != source_sha1)
+            or mat.ndim != 2 or mat.shape[0] != len(ids)):
+        print(f"⚠️ Embeddings for {policy_name} are stale: run `python -m lexie.build_index`")
+        return None
+    if mat.dtype not in (np.float16, np.float32):
+        mat = np.asarray(mat, dtype=np.float32)
+    return mat
+
+def index_version(policies) -> str:
+    """Impronta degli indici su disco (mtime/size dei file osservati): cambia a ogni rebuild."""
+    sigs = [(p, CorpusRegistry.signature(POLICY_DIR / p)) for p in sorted(set(policies))]
+    return content_key("index", EMBED_MODEL, RETRIEVAL_MODE, sigs)
+
+def warmup(policies=None) -> Dict:
+    """Modello + corpus e indici derivati in memoria prima del primo request."""
+    from .embeddings import warmup as warmup_model
+    info = {"model": warmup_model(), "policies": {}}
+    for name in policies or POLICIES:
+        corpus = get_corpus(name, POLICY_DIR)
+        if len(corpus):
+            corpus.memo("bm25", _bm25_index)
+            if get_model() is not None:
+                corpus.memo(f"dense:{EMBED_MODEL}", _dense_matrix)
+        info["policies"][name] = {"chunks": len(corpus), "mapped": corpus.mapped}
+    return info
+
+def retrieve_law_chunks(query_text: str, policy_list, top_k=8, mode: str = None):
+    return retrieve_many({"q": query_text}, {"q": policy_list}, top_k, mode=mode)["q"]
+
+def retrieve_many(queries: Dict[str, str], policy_map: Dict[str, List[str]], top_k=8,
+                  mode: str = None) -> Dict[str, List[Dict]]:
+    """
+    Retrieval batch: {chiave: query} × {chiave: [policy]} → {chiave: chunk selezionati}.
+      - tutte le query in un solo encode(batch), passando dalla cache LRU delle query
+      - per ogni policy, un'unica moltiplicazione matrice × (query che la richiedono)
+      - per ogni query, stessa selezione a quota di retrieve_law_chunks
+    top_k può essere un int o un dict {chiave: k}; mode: dense | lexical | hybrid (default config).
+    """
+    mode = (mode or RETRIEVAL_MODE).lower()
+    keys = list(queries)
+    k_of = {q: int(top_k.get(q, 8) if isinstance(top_k, dict) else top_k) for q in keys}
+    texts = list(dict.fromkeys(queries[q] for q in keys))
+    qmat = encode_queries(texts) if (texts and mode != "lexical" and get_model() is not None) else None
+    col_of = {t: i for i, t in enumerate(texts)}
+
+    # policy → query che la richiedono
+    by_policy: Dict[str, List[str]] = {}
+    for q in keys:
+        for p in policy_map.get(q) or []:
+            by_policy.setdefault(p, []).append(q)
+
+    scored: Dict[str, Dict[str, List[Dict]]] = {q: {} for q in keys}
+    for policy, qs in by_policy.items():
+        corpus = get_corpus(policy, POLICY_DIR)
+        if not len(corpus):
+            for q in qs:
+                scored[q][policy] = []
+            continue
+        cols = [col_of[queries[q]] for q in qs]
+        scores = _policy_scores(corpus, [queries[q] for q in qs],
+                                qmat[cols] if qmat is not None else None, mode)
+        # nessuna policy contribuisce più di top_k elementi: basta il suo top_k,
+        # e solo quei chunk vengono materializzati (-inf = non visitato dall'ANN)
+        for j, q in enumerate(qs):
+            col = scores[:, j]
+            scored[q][policy] = [
+                {**corpus.chunk(i), "score": float(col[i])}
+                for i in _top_indices(col, k_of[q]) if np.isfinite(col[i])
+            ]
+
+    return {q: _select_quota(scored[q], list(policy_map.get(q) or []), k_of[q]) for q in keys}
 
+def _select_quota(scored_by_policy: Dict[str, List[Dict]], policy_list: List[str], top_k: int) -> List[Dict]:
     # quota per policy
     n_per = max(1, top_k // max(1, len(policy_list)))
     selected = []
@@ -64,13 +132,101 @@ def retrieve_law_chunks(query_text: str, policy_list, top_k=8):
     return selected[:top_k]
 
 
-def _score(a: str, b: str) -> float:
-    if _ST is not None:
-        va = _ST.encode(a)
-        vb = _ST.encode(b)
-        return float(np.dot(va, vb) / (np.linalg.norm(va) * np.linalg.norm(vb) + 1e-9))
-    # fallback leggero: Jaccard su token
-    A, B = set(a.lower().split()), set(b.lower().split())
-    den = len(A | B) or 1
-    return len(A & B) / den
+def _dense_matrix(corpus) -> np.ndarray:
+    emb = load_embeddings(corpus.name, corpus.ids, corpus.directory, corpus.source_sha1())
+    if emb is None:
+        emb = encode_texts([corpus.text(i) for i in range(len(corpus))])
+    return emb
+
+def _policy_scores(corpus, query_texts: List[str], qmat, mode: str = "dense") -> np.ndarray:
+    """Matrice (n_chunk × n_query) dei punteggi di una policy."""
+    if qmat is None:
+        return _lexical_scores(corpus, query_texts)
+    emb = corpus.memo(f"dense:{EMBED_MODEL}", _dense_matrix)
+    if mode == "hybrid":
+        return _hybrid_scores(corpus, emb, _lexical_scores(corpus, query_texts), qmat)
+    return _dense_scores(corpus, emb, qmat)
+
+def _dense_scores(corpus, emb, qmat) -> np.ndarray:
+    # coseno: righe e query già normalizzate
+    if not _use_ann(corpus):
+        return (emb @ qmat.T).astype(np.float32, copy=False)
+    out = np.full((len(corpus), qmat.shape[0]), -np.inf, dtype=np.float32)
+    for j in range(qmat.shape[0]):
+        cand = _ann_candidates(corpus, qmat[j])
+        out[cand, j] = emb[cand] @ qmat[j]
+    return out
+
+def _use_ann(corpus) -> bool:
+    return ANN_INDEX == "ivf" and len(corpus) >= ANN_MIN_CHUNKS
+
+def _ann_candidates(corpus, qv) -> np.ndarray:
+    return corpus.memo(f"ivf:{EMBED_MODEL}", _ivf_index).probe(qv, ANN_NPROBE)
+
+def _lexical_scores(corpus, query_texts: List[str]) -> np.ndarray:
+    # BM25 sull'indice invertito (costruito da build_index o al primo uso)
+    bm25 = corpus.memo("bm25", _bm25_index)
+    out = np.empty((len(bm25), len(query_texts)), dtype=np.float32)
+    for j, qt in enumerate(query_texts):
+        out[:, j] = bm25.scores(qt)
+    return out
+
+def _hybrid_scores(corpus, emb, lex: np.ndarray, qmat) -> np.ndarray:
+    """
+    Candidati BM25 (top HYBRID_CANDIDATES con match lessicale) → rerank dense solo su quelli,
+    fusione reciprocal-rank: 1/(RRF_K + rank_bm25) + 1/(RRF_K + rank_dense).
+    Gli altri chunk restano a 0. Senza alcun match lessicale si usa il solo rank dense
+    (sui candidati ANN, se attivo).
+    """
+    out = np.zeros_like(lex)
+    for j in range(lex.shape[1]):
+        col = lex[:, j]
+        cand = _top_indices(col, HYBRID_CANDIDATES)
+        cand = cand[col[cand] > 0]
+        lexical = cand.size > 0
+        if not lexical:
+            cand = _ann_candidates(corpus, qmat[j]) if _use_ann(corpus) else np.arange(lex.shape[0])
+        dense = np.asarray(emb[cand] @ qmat[j], dtype=np.float32)
+        r_dense = np.empty(cand.size, dtype=np.float32)
+        r_dense[np.lexsort((cand, -dense))] = np.arange(1, cand.size + 1)
+        fused = 1.0 / (RRF_K + r_dense)
+        if lexical:
+            fused += 1.0 / (RRF_K + np.arange(1, cand.size + 1, dtype=np.float32))  # cand già in ordine BM25
+        out[cand, j] = fused
+    return out
+
+def _bm25_index(corpus) -> BM25Index:
+    digest = corpus.source_sha1()
+    try:
+        idx = BM25Index.load(corpus.directory)
+        if len(idx) == len(corpus) and (digest is None or idx.source_sha1 == digest):
+            return idx
+        print(f"⚠️ BM25 index for {corpus.name} is stale: run `python -m lexie.build_index`")
+    except FileNotFoundError:
+        pass
+    except Exception as e:
+        print(f"⚠️ Invalid BM25 index for {corpus.name}: {e}")
+    return BM25Index.build((corpus.text(i) for i in range(len(corpus))), source_sha1=digest)
+
+def _ivf_index(corpus) -> IVFIndex:
+    digest = corpus.source_sha1()
+    try:
+        idx = IVFIndex.load(corpus.directory)
+        if len(idx) == len(corpus) and idx.model == EMBED_MODEL and (digest is None or idx.source_sha1 == digest):
+            return idx
+        print(f"⚠️ IVF index for {corpus.name} is stale: run `python -m lexie.build_index`")
+    except FileNotFoundError:
+        pass
+    except Exception as e:
+        print(f"⚠️ Invalid IVF index for {corpus.name}: {e}")
+    emb = corpus.memo(f"dense:{EMBED_MODEL}", _dense_matrix)
+    return IVFIndex.build(emb, model=EMBED_MODEL, source_sha1=digest)
 
+def _top_indices(scores: np.ndarray, k: int) -> np.ndarray:
+    """Indici dei k punteggi migliori, ordinati (a parità di score vince l'ordine originale)."""
+    n = scores.shape[0]
+    k = max(0, min(int(k), n))
+    if k == 0:
+        return np.empty(0, dtype=np.int64)
+    idx = np.arange(n) if k == n else np.argpartition(-scores, k - 1)[:k]
+    return idx[np.lexsort((idx, -scores[idx]))]
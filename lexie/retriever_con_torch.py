@@ -1,44 +1,24 @@
-import os
-import json
 import numpy as np
-from sentence_transformers import SentenceTransformer, util
 from pathlib import Path
+from .corpus import get_corpus
+from .embeddings import get_model, encode_queries
 POLICY_DIR = Path(__file__).parent / "policies"
 
-# Carica il modello solo una volta
-embedding_model = SentenceTransformer('all-MiniLM-L6-v2')
-
 def cosine_similarity(a, b):
     return np.dot(a, b) / (np.linalg.norm(a) * np.linalg.norm(b))
 
 def load_chunks(policy_name):
-    path = POLICY_DIR / policy_name / "chunks.jsonl"  # <-- usa path corretto
-    if not path.exists():
-        print(f"❌ File not found: {path}")
-        return []
-    out = []
-    with open(path, "r", encoding="utf-8") as f:
-        for line in f:
-            if not line.strip():
-                continue
-            raw = json.loads(line)
-            # normalizzazione pagina
-            page = raw.get("page") or raw.get("page_num") or raw.get("p")
-            try:
-                page = int(page) if page is not None else None
-            except Exception:
-                page = None
-            out.append({
-                "id": raw.get("id") or f"{policy_name}:{page if page is not None else '?'}",
-                "text": raw.get("text") or raw.get("chunk") or "",
-                "page": page,
-                "source": policy_name,
-            })
-    return out
+    # servito dal registry di processo: il JSONL viene riletto solo se cambia su disco;
+    # copia superficiale come retriever.load_chunks: i dict in cache non devono essere modificati
+    return [dict(c) for c in get_corpus(policy_name, POLICY_DIR).chunks]
 
 def retrieve_law_chunks(query_text, policy_list, top_k=5):
+    # modello condiviso, caricato una sola volta al primo uso
+    embedding_model = get_model()
+    if embedding_model is None:
+        raise RuntimeError("sentence-transformers not available. Run: pip install sentence-transformers")
     results = []
-    query_vec = embedding_model.encode(query_text)
+    query_vec = encode_queries([query_text])[0]
 
     for policy in policy_list:
         chunks = load_chunks(policy)
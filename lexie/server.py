@@ -0,0 +1,294 @@
+# lexie/server.py — servizio HTTP locale (stdlib): modello e indici caldi, coda di job limitata
+#   python -m lexie.server [--host 127.0.0.1] [--port 8765] [--workers 4] [--queue 32]
+#
+#   POST /analyze/free_text   {"user_text": "...", "top_k": 12}
+#   POST /analyze/document    {"document_path": "..."} (sotto LEXIE_SERVER_DOCUMENT_DIR)  oppure il PDF come corpo
+#                             (Content-Type: application/pdf)
+#        ?wait=0 → 202 + job_id subito; ?pdf=1 → report PDF in background (non ritarda la risposta)
+#   GET  /jobs/<id>           stato/risultato di un job
+#   GET  /reports/<id>        stato del report PDF (renderizzato in background, _meta.pdf_job)
+#   GET  /health              liveness + statistiche coda
+#   GET  /ready               200 a warm-up completato, 503 prima
+import argparse
+import json
+import queue
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from pathlib import Path
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, Optional
+from urllib.parse import parse_qs, urlparse
+from .config import (SERVER_HOST, SERVER_PORT, SERVER_WORKERS, SERVER_QUEUE_SIZE, SERVER_WAIT_S,
+                     SERVER_MAX_UPLOAD_MB, UPLOAD_DIR, SERVER_DOCUMENT_DIR)
+from . import call_agent, reports
+
+JOB_HISTORY = 512  # job conclusi conservati per GET /jobs/<id>
+
+
+class QueueFull(Exception):
+    pass
+
+
+def _allowed_document(path: str, root=None) -> str:
+    """document_path da JSON: relativo a root (SERVER_DOCUMENT_DIR) e senza uscirne (.., symlink)."""
+    root = Path(root or SERVER_DOCUMENT_DIR).resolve()
+    p = (root / path).resolve()
+    if not p.is_relative_to(root):
+        raise PermissionError(f"document_path must be inside {root}")
+    return str(p)
+
+
+class Job:
+    def __init__(self, payload: Dict, generate_pdf: bool = False, upload=None):
+        self.id = uuid.uuid4().hex[:12]
+        self.payload = payload
+        self.generate_pdf = generate_pdf
+        self.upload = upload            # PDF caricato: si cancella a fine job
+        self.status = "queued"          # queued | running | done | error
+        self.result = None
+        self.error = None
+        self.created = time.monotonic()
+        self.seconds = None
+        self.done = threading.Event()
+
+    def to_dict(self) -> Dict:
+        out = {"job_id": self.id, "status": self.status}
+        if self.seconds is not None:
+            out["seconds"] = self.seconds
+        if self.status == "done":
+            out["result"] = self.result
+        elif self.status == "error":
+            out["error"] = self.error
+        return out
+
+
+class AnalysisService:
+    """
+    Worker thread che eseguono route_fn sui job di una coda limitata: oltre queue_size job in
+    attesa submit() solleva QueueFull (→ 429). Il warm-up (modello, corpus, indici) gira una volta
+    all'avvio; i job accodati nel frattempo vengono comunque eseguiti.
+    """
+
+    def __init__(self, workers: int = None, queue_size: int = None, route_fn: Callable = None):
+        self.workers = max(1, workers or SERVER_WORKERS)
+        self.queue = queue.Queue(maxsize=max(1, queue_size or SERVER_QUEUE_SIZE))
+        self.route_fn = route_fn or call_agent.route
+        self.jobs: "OrderedDict[str, Job]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._threads = []
+        self.running = 0
+        self.completed = 0
+        self.failed = 0
+        self.ready = threading.Event()
+        self.warmup_info: Optional[Dict] = None
+        self.started = time.time()
+
+    def start(self, warm: bool = True) -> "AnalysisService":
+        for i in range(self.workers):
+            t = threading.Thread(target=self._worker, name=f"lexie-server-{i}", daemon=True)
+            t.start()
+            self._threads.append(t)
+        if warm:
+            threading.Thread(target=self._warmup, name="lexie-warmup", daemon=True).start()
+        else:
+            self.ready.set()
+        return self
+
+    def _warmup(self):
+        t0 = time.perf_counter()
+        try:
+            from .retriever import warmup
+            from .tokens import get_counter
+            from . import loaders, pdf_reporter  # noqa: F401  (pdfminer/reportlab importati una volta)
+            info = {"retriever": warmup(), "tokenizer": get_counter().name}
+        except Exception as e:
+            # il servizio resta utilizzabile: il primo request pagherà il caricamento
+            print(f"⚠️ Warm-up failed ({type(e).__name__}: {e})")
+            info = {"error": f"{type(e).__name__}: {e}"}
+        info["seconds"] = round(time.perf_counter() - t0, 3)
+        self.warmup_info = info
+        self.ready.set()
+
+    def submit(self, payload: Dict, generate_pdf: bool = False, upload=None) -> Job:
+        job = Job(payload, generate_pdf, upload)
+        try:
+            self.queue.put_nowait(job)
+        except queue.Full:
+            raise QueueFull(f"queue full ({self.queue.maxsize} jobs waiting)")
+        with self._lock:
+            self.jobs[job.id] = job
+            while len(self.jobs) > JOB_HISTORY:
+                oldest = next(iter(self.jobs.values()))
+                if not oldest.done.is_set():
+                    break
+                self.jobs.popitem(last=False)
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            return self.jobs.get(job_id)
+
+    def _worker(self):
+        while True:
+            job = self.queue.get()
+            if job is None:
+                return
+            with self._lock:
+                self.running += 1
+            job.status = "running"
+            try:
+                job.result = self.route_fn(job.payload, generate_pdf=job.generate_pdf, background_pdf=True)
+                job.status = "done"
+            except Exception as e:
+                job.error = f"{type(e).__name__}: {e}"
+                job.status = "error"
+            finally:
+                job.seconds = round(time.monotonic() - job.created, 3)
+                if job.upload is not None:
+                    job.upload.unlink(missing_ok=True)
+                with self._lock:
+                    self.running -= 1
+                    self.completed += job.status == "done"
+                    self.failed += job.status == "error"
+                job.done.set()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {"ready": self.ready.is_set(), "workers": self.workers, "running": self.running,
+                    "queued": self.queue.qsize(), "queue_size": self.queue.maxsize,
+                    "completed": self.completed, "failed": self.failed,
+                    "uptime_s": round(time.time() - self.started, 1), "warmup": self.warmup_info}
+
+    def stop(self):
+        for _ in self._threads:
+            self.queue.put(None)
+        for t in self._threads:
+            t.join(timeout=5)
+
+
+class Handler(BaseHTTPRequestHandler):
+    server_version = "Lexie"
+    service: AnalysisService = None  # impostato da make_server
+
+    def _send(self, code: int, body: Dict, headers: Dict = None):
+        data = json.dumps(body, ensure_ascii=False).encode("utf-8")
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, fmt, *args):
+        print(f"[Lexie server] {self.address_string()} {fmt % args}")
+
+    def do_GET(self):
+        path = urlparse(self.path).path.rstrip("/")
+        if path == "/health":
+            return self._send(200, {"status": "ok", **self.service.stats()})
+        if path == "/ready":
+            ready = self.service.ready.is_set()
+            return self._send(200 if ready else 503, {"ready": ready})
+        if path.startswith("/jobs/"):
+            job = self.service.get(path[len("/jobs/"):])
+            if job is None:
+                return self._send(404, {"error": "unknown job"})
+            return self._send(200, job.to_dict())
+        if path.startswith("/reports/"):
+            rep = reports.get_report(path[len("/reports/"):])
+            if rep is None:
+                return self._send(404, {"error": "unknown report"})
+            return self._send(200, rep.to_dict())
+        self._send(404, {"error": "not found"})
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        mode = {"/analyze/free_text": "free_text", "/analyze/document": "document"}.get(url.path.rstrip("/"))
+        if mode is None:
+            return self._send(404, {"error": "not found"})
+        qs = parse_qs(url.query)
+        wait = (qs.get("wait") or ["1"])[0] not in ("0", "false")
+        generate_pdf = (qs.get("pdf") or ["0"])[0] in ("1", "true")
+
+        length = self.headers.get("Content-Length")
+        if length is None:
+            return self._send(411, {"error": "Content-Length required"})
+        upload = None
+        try:
+            if not length.strip().isdigit():   # niente negativi: rfile.read(-1) leggerebbe fino alla chiusura
+                raise ValueError(f"invalid Content-Length: {length!r}")
+            length = int(length)
+            if length > SERVER_MAX_UPLOAD_MB * 1024 * 1024:
+                return self._send(413, {"error": f"body larger than {SERVER_MAX_UPLOAD_MB} MB"})
+            body = self.rfile.read(length)
+            if mode == "document" and (self.headers.get("Content-Type") or "").startswith("application/pdf"):
+                UPLOAD_DIR.mkdir(parents=True, exist_ok=True)
+                upload = UPLOAD_DIR / f"{uuid.uuid4().hex}.pdf"
+                upload.write_bytes(body)
+                payload = {"document_path": str(upload)}
+            else:
+                payload = json.loads(body or b"{}")
+                if not isinstance(payload, dict):
+                    raise ValueError("JSON body must be an object")
+                if payload.get("document_path"):
+                    payload["document_path"] = _allowed_document(str(payload["document_path"]))
+                    if mode == "document" and not Path(payload["document_path"]).is_file():
+                        raise FileNotFoundError(f"document not found: {payload['document_path']}")
+            payload["mode"] = mode
+            call_agent._validate(payload)
+            job = self.service.submit(payload, generate_pdf, upload)
+        except Exception as e:
+            # il job non parte: il PDF caricato non serve più
+            if upload is not None:
+                upload.unlink(missing_ok=True)
+            if isinstance(e, QueueFull):
+                return self._send(429, {"error": str(e)}, {"Retry-After": "1"})
+            if isinstance(e, PermissionError):
+                return self._send(403, {"error": str(e)})
+            if isinstance(e, FileNotFoundError):
+                return self._send(404, {"error": str(e)})
+            if isinstance(e, (ValueError, TypeError)):   # JSON non valido, tipi sbagliati (top_k: [1])
+                return self._send(400, {"error": str(e)})
+            return self._send(500, {"error": f"{type(e).__name__}: {e}"})
+
+        if not wait or not job.done.wait(SERVER_WAIT_S):
+            return self._send(202, job.to_dict(), {"Location": f"/jobs/{job.id}"})
+        self._send(200 if job.status == "done" else 500, job.to_dict())
+
+
+def make_server(host: str = None, port: int = None, service: AnalysisService = None) -> ThreadingHTTPServer:
+    service = service or AnalysisService()
+    handler = type("LexieHandler", (Handler,), {"service": service})
+    httpd = ThreadingHTTPServer((host or SERVER_HOST, SERVER_PORT if port is None else port), handler)
+    httpd.daemon_threads = True
+    httpd.service = service
+    return httpd
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(prog="python -m lexie.server", description="Local Lexie analysis service.")
+    ap.add_argument("--host", default=SERVER_HOST)
+    ap.add_argument("--port", type=int, default=SERVER_PORT)
+    ap.add_argument("--workers", type=int, default=SERVER_WORKERS, help="analyses running at the same time")
+    ap.add_argument("--queue", type=int, default=SERVER_QUEUE_SIZE, help="waiting jobs before answering 429")
+    ap.add_argument("--no-warmup", action="store_true", help="skip loading model and indexes at startup")
+    args = ap.parse_args(argv)
+
+    service = AnalysisService(args.workers, args.queue).start(warm=not args.no_warmup)
+    httpd = make_server(args.host, args.port, service)
+    print(f"✅ Lexie server listening on http://{args.host}:{httpd.server_port} "
+          f"({service.workers} workers, queue {service.queue.maxsize})")
+    try:
+        httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        httpd.server_close()
+        service.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+# lexie/tokens.py — conteggio token pluggable: BPE (tiktoken) se disponibile, altrimenti euristica 4 caratteri/token
+import multiprocessing
+import threading
+from .config import MODEL_ID, TOKENIZER, TOKENIZER_ENCODING
+
+
+class CharHeuristic:
+    """Approssimazione storica di Lexie: 4 caratteri ≈ 1 token."""
+    name = "heuristic"
+
+    def count(self, text: str) -> int:
+        return max(1, len(text) // 4) if text else 0
+
+    def truncate(self, text: str, max_tokens: int) -> str:
+        return text[:max(0, max_tokens) * 4]
+
+    def chars_per_token(self, sample: str = "") -> float:
+        return 4.0
+
+
+class TiktokenCounter:
+    """
+    BPE del modello (tiktoken). Offline: il vocabolario viene letto dalla cache di tiktoken
+    (TIKTOKEN_CACHE_DIR), quindi basta copiarlo lì una volta.
+    """
+
+    def __init__(self, encoding: str = None, model: str = MODEL_ID):
+        import tiktoken
+        if encoding:
+            self.enc = tiktoken.get_encoding(encoding)
+        else:
+            try:
+                self.enc = tiktoken.encoding_for_model(model)
+            except KeyError:
+                self.enc = tiktoken.get_encoding("o200k_base")
+        self.name = f"tiktoken:{self.enc.name}"
+
+    def _ids(self, text: str):
+        return self.enc.encode(text or "", disallowed_special=())
+
+    def count(self, text: str) -> int:
+        return len(self._ids(text))
+
+    def truncate(self, text: str, max_tokens: int) -> str:
+        ids = self._ids(text)
+        return text if len(ids) <= max_tokens else self.enc.decode(ids[:max(0, max_tokens)])
+
+    def chars_per_token(self, sample: str = "") -> float:
+        """Caratteri per token misurati sul testo: convertono budget in token in offset di caratteri."""
+        n = self.count(sample)
+        return min(8.0, max(1.5, len(sample) / n)) if n else 4.0
+
+
+_LOCK = threading.Lock()
+_counter = None
+
+def _make_counter():
+    if TOKENIZER == "heuristic":
+        return CharHeuristic()
+    try:
+        return TiktokenCounter(TOKENIZER_ENCODING or None)
+    except Exception as e:
+        # tiktoken assente o vocabolario non raggiungibile offline; l'avviso solo nel processo
+        # principale, non in ogni worker di batch/estrazione
+        if multiprocessing.parent_process() is None:
+            print(f"⚠️ BPE tokenizer not available ({type(e).__name__}: {e}): using 4 chars/token")
+        return CharHeuristic()
+
+def get_counter():
+    global _counter
+    if _counter is None:
+        with _LOCK:
+            if _counter is None:
+                _counter = _make_counter()
+    return _counter
+
+def set_counter(counter) -> None:
+    """Sostituisce il contatore (oggetto con count / truncate / chars_per_token); None = ricrea il default."""
+    global _counter
+    with _LOCK:
+        _counter = counter
+
+def count_tokens(text: str) -> int:
+    return get_counter().count(text)
+
+def truncate_tokens(text: str, max_tokens: int) -> str:
+    return get_counter().truncate(text, max_tokens)
@@ -1,11 +1,13 @@
 # tools/analyze_document.py
 from __future__ import annotations
-from typing import Dict, Any, List
+from typing import Dict, Any, Iterable, List
 from pathlib import Path
-from ..loaders import load_file_text
-from ..retriever import retrieve_law_chunks
-from ..legal_analyzer_gpt import legal_analyze_with_gpt, build_prompt
+from ..loaders import iter_file_pages, page_count
+from ..retriever import retrieve_many
+from ..legal_analyzer_gpt import legal_analyze_with_gpt, alegal_analyze_with_gpt, build_prompt
+from ..tokens import count_tokens, get_counter
 from .postprocess import normalize_contract
+from .signals import GDPR_SIGNALS, LAW_SIGNALS, signal_lines
 from ..config import TOP_K as TOP_K_DEFAULT
 # in cima al file, con gli altri import
 try:
@@ -20,54 +22,194 @@ except Exception:
     CHUNK_OVERLAP_TOKENS = 60
     CHUNK_MIN_TOKENS = 200
     USER_TEXT_CAP = 16000
+import asyncio
 import re
+import time
+from bisect import bisect_right
+from concurrent.futures import Executor, ThreadPoolExecutor, TimeoutError as FuturesTimeout
 
-_GDPR_KWS = (
-    r"(consent|lawful|legal\s+basis|art\.?\s*5|art\.?\s*6|art\.?\s*9|art\.?\s*13|art\.?\s*14|art\.?\s*22|dpia|data\s+minimi[sz]ation|personal\s+data|data\s+subject|profiling|automated\s+decision)"
-)
+try:
+    from ..config import LLM_TIMEOUT
+except Exception:
+    LLM_TIMEOUT = 90.0
+
+try:
+    from ..config import DOC_READ_STRATEGY, DOC_SCAN_CAP
+except Exception:
+    DOC_READ_STRATEGY = "first_n"
+    DOC_SCAN_CAP = 64000
+
+# pool condiviso (non un context manager: un timeout non deve attendere la chiamata appesa)
+_LLM_POOL = ThreadPoolExecutor(max_workers=8, thread_name_prefix="lexie-llm")
 
 def _extract_gdpr_signals(text: str, max_lines: int = 20) -> str:
-    # prendi righe/sentenze che contengono keyword GDPR
-    lines = re.split(r'(?<=[\.\?!])\s+|\n+', text)
-    hits = [ln.strip() for ln in lines if re.search(_GDPR_KWS, ln, flags=re.I)]
-    # dedup semplice preservando ordine
-    seen, out = set(), []
-    for h in hits:
-        k = h.lower()
-        if k not in seen:
-            out.append(h)
-            seen.add(k)
-        if len(out) >= max_lines:
-            break
-    return "\n".join(out)
+    # frasi con keyword GDPR (scanner compilato, un passaggio, stop a max_lines)
+    return "\n".join(signal_lines(text, GDPR_SIGNALS, max_lines))
 
 
 # --- token-aware chunking ---
 def _approx_tokens(s: str) -> int:
-    return max(1, len(s) // 4)
+    return max(1, count_tokens(s))
 
-def _chunk_by_tokens(text: str, max_tokens=350, overlap_tokens=60, min_tokens=200):
-    if not text: return []
-    max_c, ovl_c = max_tokens * 4, overlap_tokens * 4
-    out, i, N = [], 0, len(text)
-    while i < N:
+_CALIBRATION_CHARS = 4000
+_SENT_END = re.compile(r"[.!?]")
+
+def _iter_spans(texts: Iterable[str], max_tokens=350, overlap_tokens=60, chars_per_token: float = None):
+    """
+    Chunking a finestra scorrevole su un flusso di testi (pagine) uniti da "\n\n", in un solo passaggio.
+    Produce (start, end, chunk): span assoluto nel flusso (già senza spazi ai bordi) e testo.
+    - i budget in token diventano offset in caratteri col rapporto caratteri/token del
+      tokenizer, misurato sui primi caratteri del flusso
+    - le fini frase si trovano una volta sola (una scansione regex per pagina); il taglio
+      cade sull'ultima nel 40% finale della finestra, altrimenti a max_c caratteri
+    - un chunk esce appena il flusso ha max_c caratteri oltre il suo inizio: il risultato
+      è identico a quello sul testo intero, e il buffer tiene solo la coda non consumata
+    """
+    buf, base = "", 0      # buf = flusso[base:]
+    ends = []              # offset assoluti subito dopo un . ! ?
+    i = max_c = ovl_c = 0
+
+    def calibrate():
+        nonlocal max_c, ovl_c
+        cpt = chars_per_token or get_counter().chars_per_token(buf[:_CALIBRATION_CHARS])
+        max_c, ovl_c = max(1, int(max_tokens * cpt)), int(overlap_tokens * cpt)
+
+    def step(N):
+        nonlocal i
         j = min(N, i + max_c)
         k = j
-        while k > i + int(0.6 * max_c) and k < N and text[k-1] not in ".!?":
-            k -= 1
-        if k <= i + int(0.6 * max_c): k = j
-        chunk = text[i:k].strip()
-        if chunk: out.append(chunk)
-        i += max(1, (len(chunk) * 4 - ovl_c) // 4)
-    merged, buf = [], ""
-    for ch in out:
-        if _approx_tokens(ch) < min_tokens: buf = (buf + "\n" + ch).strip()
+        if j < N:
+            x = bisect_right(ends, j) - 1
+            if x >= 0 and ends[x] > i + int(0.6 * max_c):
+                k = ends[x]
+        a, b = i, k
+        while a < b and buf[a - base].isspace(): a += 1
+        while b > a and buf[b - 1 - base].isspace(): b -= 1
+        # il chunk successivo riparte overlap token prima della fine; l'ultimo chiude il flusso
+        i = N if k >= N else max(i + 1, k - ovl_c)
+        return a, b
+
+    for n, t in enumerate(texts):
+        off = base + len(buf) + (0 if n == 0 else 2)
+        buf += t if n == 0 else "\n\n" + t
+        ends.extend(off + m.end() for m in _SENT_END.finditer(t))
+        if not max_c:
+            if len(buf) < _CALIBRATION_CHARS:
+                continue
+            calibrate()
+        N = base + len(buf)
+        while i + max_c < N:
+            a, b = step(N)
+            if a < b: yield a, b, buf[a - base:b - base]
+        buf, base = buf[i - base:], i    # scarta il testo già consumato
+        del ends[:bisect_right(ends, i)]
+    if not max_c:
+        calibrate()
+    N = base + len(buf)
+    while i < N:
+        a, b = step(N)
+        if a < b: yield a, b, buf[a - base:b - base]
+
+def _iter_chunks(texts: Iterable[str], max_tokens=350, overlap_tokens=60, chars_per_token: float = None):
+    for _, _, chunk in _iter_spans(texts, max_tokens, overlap_tokens, chars_per_token):
+        yield chunk
+
+def chunk_spans(text: str, max_tokens=350, overlap_tokens=60) -> List[tuple]:
+    """Span (start, end) dei chunk sul testo originale: text[start:end] è il chunk."""
+    return [(a, b) for a, b, _ in _iter_spans([text], max_tokens, overlap_tokens)]
+
+def _merge_small(chunks: List[str], min_tokens=200) -> List[str]:
+    # chunk corti consecutivi uniti con "\n" (join unico, niente concatenazioni ripetute)
+    merged, small = [], []
+    for ch in chunks:
+        if _approx_tokens(ch) < min_tokens:
+            small.append(ch)
         else:
-            if buf: merged.append(buf); buf = ""
+            if small: merged.append("\n".join(small)); small = []
             merged.append(ch)
-    if buf: merged.append(buf)
+    if small: merged.append("\n".join(small))
     return merged
 
+def _chunk_by_tokens(text: str, max_tokens=350, overlap_tokens=60, min_tokens=200):
+    if not text: return []
+    return _merge_small(list(_iter_chunks([text], max_tokens, overlap_tokens)), min_tokens)
+
+# --- lettura del documento entro il budget USER_TEXT_CAP ---
+READ_STRATEGIES = ("first_n", "signal_dense", "spread")
+
+def _read_first_n(doc_path, cap: int, info: Dict = None):
+    """Pagine in ordine, chunking incrementale: ci si ferma appena i chunk coprono `cap`."""
+    pages, raw, size = [], [], 0
+    it = iter_file_pages(doc_path, info=info)
+
+    def _page_texts():
+        for p in it:
+            pages.append(p)
+            yield p.get("text") or ""
+
+    complete = True
+    for ch in _iter_chunks(_page_texts(), CHUNK_MAX_TOKENS, CHUNK_OVERLAP_TOKENS):
+        raw.append(ch)
+        size += len(ch) + 2
+        if size >= cap:
+            complete = False
+            break
+    it.close()    # le pagine restanti non vengono nemmeno parse
+    return pages, raw, complete
+
+def _read_signal_dense(doc_path, cap: int, info: Dict = None):
+    """Esamina fino a DOC_SCAN_CAP caratteri e tiene i chunk più densi di segnali GDPR/AI Act, in ordine di documento."""
+    pages, raw, complete = _read_first_n(doc_path, max(cap, DOC_SCAN_CAP), info)
+    density = [LAW_SIGNALS.count(ch) / _approx_tokens(ch) for ch in raw]
+    keep, size = [], 0
+    for i in sorted(range(len(raw)), key=lambda i: -density[i]):
+        if size >= cap:
+            break
+        keep.append(i)
+        size += len(raw[i]) + 2
+    return pages, [raw[i] for i in sorted(keep)], complete
+
+def _spread_order(n: int) -> List[int]:
+    """Indici 0..n-1 in ordine di campionamento progressivo: estremi, metà, quarti, ottavi..."""
+    out, seen, parts = [], set(), 1
+    while len(out) < n:
+        for j in range(parts + 1):
+            i = j * (n - 1) // parts
+            if i not in seen:
+                seen.add(i)
+                out.append(i)
+        parts *= 2
+    return out
+
+def _read_spread(doc_path, cap: int, info: Dict = None, first_batch: int = 4):
+    """Pagine campionate su tutto il documento; ogni pagina contribuisce in proporzione alla sua lunghezza."""
+    try:
+        n = page_count(doc_path)
+    except Exception as e:
+        # come load_file_text: documento illeggibile → nessuna pagina, l'analisi prosegue
+        print(f"❌ Failed to load PDF: {e}")
+        return [], [], True
+    if info is not None:
+        info["pages_total"] = n
+    order = _spread_order(n)
+    pages, size, a, batch = [], 0, 0, first_batch
+    while a < len(order) and size < cap:
+        sel = [i + 1 for i in order[a:a + batch]]
+        a += len(sel)
+        for p in iter_file_pages(doc_path, pages=sel):
+            pages.append(p)
+            size += len(p.get("text") or "") + 2
+        # lotto successivo stimato dalla lunghezza media delle pagine lette
+        avg = size / a if size else 0
+        batch = max(1, -(-(cap - size) // int(avg))) if avg >= 1 else first_batch
+    pages.sort(key=lambda p: p["page"])
+    ratio = min(1.0, cap / size) if size else 1.0
+    texts = [(p.get("text") or "")[:int(len(p.get("text") or "") * ratio)] for p in pages]
+    raw = list(_iter_chunks(texts, CHUNK_MAX_TOKENS, CHUNK_OVERLAP_TOKENS))
+    return pages, raw, a >= len(order) and ratio == 1.0
+
+_READERS = {"first_n": _read_first_n, "signal_dense": _read_signal_dense, "spread": _read_spread}
+
 def _dedup_list(xs: List[str]) -> List[str]:
     seen, out = set(), []
     for x in xs:
@@ -81,19 +223,32 @@ def _norm_source(x: str) -> str:
     if "ai" in s and "act" in s: return "ai_act"
     return "gdpr"
 
-def handle(payload: Dict[str, Any]) -> Dict[str, Any]:
+def prepare(payload: Dict[str, Any]) -> Dict[str, Any]:
+    """Fasi CPU: estrazione, chunking, retrieval e costruzione dei due prompt."""
     assert payload.get("mode") == "document", "DocAnalyzer expects mode=document"
     doc_path = payload.get("document_path")
     assert doc_path and Path(doc_path).exists(), f"Document not found: {doc_path}"
 
-    # 1) Carica + chunking token-aware (cap ~16k)
-    pages = load_file_text(doc_path)
+    # 1) Lettura entro il budget: estrazione, chunking e segnali si fermano quando USER_TEXT_CAP è coperto
+    strategy = (payload.get("read_strategy") or DOC_READ_STRATEGY).lower()
+    if strategy not in _READERS:
+        raise ValueError(f"read_strategy must be one of {', '.join(READ_STRATEGIES)}")
+    info: Dict[str, Any] = {}
+    pages, raw, complete = _READERS[strategy](doc_path, USER_TEXT_CAP, info)
     full_text = "\n\n".join((p.get("text") or "") for p in pages)
-    chunks = _chunk_by_tokens(full_text, CHUNK_MAX_TOKENS, CHUNK_OVERLAP_TOKENS, CHUNK_MIN_TOKENS)
+    chunks = _merge_small(raw, CHUNK_MIN_TOKENS)
     signals_gdpr = _extract_gdpr_signals(full_text, max_lines=20)
 
     # precedence ai segnali GDPR, poi il resto
     user_text = (signals_gdpr + "\n\n" + "\n\n".join(chunks))[:USER_TEXT_CAP]
+    reading = {
+        "strategy": strategy,
+        "pages_read": len(pages),
+        "pages_total": info.get("pages_total") or (len(pages) if complete else 0),
+        "chars_read": len(full_text),
+        "chars_used": len(user_text),
+        "complete": complete,
+    }
 
     # 2) Retrieval separato con query-expansion e quota 50/50
     top_k = int(payload.get("top_k", TOP_K_DEFAULT or 12))
@@ -109,29 +264,91 @@ def handle(payload: Dict[str, Any]) -> Dict[str, Any]:
         "[AI Act focus: Art.5 prohibited; Art.10 data & governance; Art.13 transparency; Art.14 oversight; Art.15 robustness; Annex III]"
     )
 
-    chunks_gdpr = retrieve_law_chunks(gdpr_query, ["gdpr"],   top_k=k_gdpr)
-    chunks_ai   = retrieve_law_chunks(ai_query,   ["ai_act"], top_k=k_ai)
-    lawchunks = chunks_gdpr + chunks_ai
-
-    # 3) Prompt duale con obbligo GDPR
-    prompt_gdpr = build_prompt(
-        "MANDATORY: Evaluate GDPR applicability to this corporate AI policy. "
-        "Identify gaps vs Arts 5,6,9,13,14,22,35 even if 'personal data' is not explicitly mentioned. "
-        "Cite only GDPR. Do not discuss the AI Act.\n\n" + user_text,
-        chunks_gdpr
+    # entrambe le query in un solo encode batch
+    hits = retrieve_many(
+        {"gdpr": gdpr_query, "ai_act": ai_query},
+        {"gdpr": ["gdpr"],   "ai_act": ["ai_act"]},
+        top_k={"gdpr": k_gdpr, "ai_act": k_ai},
     )
-    prompt_ai = build_prompt(
-        "MANDATORY: Evaluate ONLY the EU AI Act requirements for this policy. Cite only the AI Act.\n\n" + user_text,
-        chunks_ai
-    )
-
+    chunks_gdpr = hits["gdpr"]
+    chunks_ai   = hits["ai_act"]
 
     # 3) Prompt duale
     prompt_gdpr = build_prompt("FOCUS: Evaluate GDPR only.\n\n" + user_text, chunks_gdpr)
     prompt_ai   = build_prompt("FOCUS: Evaluate AI Act only.\n\n" + user_text, chunks_ai)
 
-    raw_gdpr = legal_analyze_with_gpt(prompt_gdpr, chunks_gdpr, temperature=0.0, seed=42)
-    raw_ai   = legal_analyze_with_gpt(prompt_ai,   chunks_ai,   temperature=0.0, seed=43)
+    return {
+        "top_k": top_k,
+        "pages": len(pages),
+        "reading": reading,
+        "chunks_gdpr": chunks_gdpr,
+        "chunks_ai": chunks_ai,
+        "prompt_gdpr": prompt_gdpr,
+        "prompt_ai": prompt_ai,
+    }
+
+def analyze(prep: Dict[str, Any], timeout: float = None, executor: Executor = None):
+    """
+    Le due analisi (GDPR seed 42, AI Act seed 43) partono in parallelo su executor (default _LLM_POOL).
+    Ritorna (raw_gdpr, raw_ai, errors): se una fallisce o supera il timeout resta {} e l'errore
+    finisce in errors; se falliscono entrambe si solleva l'eccezione.
+    Il timeout vale da quando le chiamate sono sottomesse: chi ha molte analisi in parallelo passi
+    un executor con 2 thread per analisi, così nessuna chiamata consuma il timeout in coda.
+    """
+    timeout = LLM_TIMEOUT if timeout is None else timeout
+    pool = executor or _LLM_POOL
+    # la chiamata riceve la stessa scadenza: fut.cancel() non ferma una richiesta già partita,
+    # così retry e timeout HTTP finiscono entro il deadline e il thread del pool si libera
+    deadline = time.monotonic() + timeout
+    futs = {
+        "GDPR":   pool.submit(legal_analyze_with_gpt, prep["prompt_gdpr"], prep["chunks_gdpr"], temperature=0.0, seed=42,
+                              deadline=deadline),
+        "AI Act": pool.submit(legal_analyze_with_gpt, prep["prompt_ai"],   prep["chunks_ai"],   temperature=0.0, seed=43,
+                              deadline=deadline),
+    }
+    raws: Dict[str, Dict[str, Any]] = {}
+    errors: Dict[str, str] = {}
+    for law, fut in futs.items():
+        try:
+            raws[law] = fut.result(timeout=max(0.0, deadline - time.monotonic()))
+        except FuturesTimeout:
+            fut.cancel()
+            errors[law] = f"TimeoutError: no answer within {timeout:g}s"
+        except Exception as e:
+            errors[law] = f"{type(e).__name__}: {e}"
+    if len(errors) == len(futs):
+        raise RuntimeError(f"Both analyses failed: {errors}")
+    return raws.get("GDPR") or {}, raws.get("AI Act") or {}, errors
+
+async def aanalyze(prep: Dict[str, Any], timeout: float = None):
+    """
+    Come analyze(), ma le due chiamate sono coroutine nell'event loop del chiamante (nessun thread).
+    Il timeout di ciascuna parte quando ottiene llm_semaphore(): l'attesa in coda non lo consuma.
+    """
+    timeout = LLM_TIMEOUT if timeout is None else timeout
+    calls = {
+        "GDPR":   alegal_analyze_with_gpt(prep["prompt_gdpr"], prep["chunks_gdpr"], temperature=0.0, seed=42, timeout=timeout),
+        "AI Act": alegal_analyze_with_gpt(prep["prompt_ai"],   prep["chunks_ai"],   temperature=0.0, seed=43, timeout=timeout),
+    }
+    outs = await asyncio.gather(*calls.values(), return_exceptions=True)
+    raws: Dict[str, Dict[str, Any]] = {}
+    errors: Dict[str, str] = {}
+    for law, out in zip(calls, outs):
+        if isinstance(out, asyncio.TimeoutError):
+            errors[law] = f"TimeoutError: no answer within {timeout:g}s"
+        elif isinstance(out, BaseException):
+            errors[law] = f"{type(out).__name__}: {out}"
+        else:
+            raws[law] = out
+    if len(errors) == len(calls):
+        raise RuntimeError(f"Both analyses failed: {errors}")
+    return raws.get("GDPR") or {}, raws.get("AI Act") or {}, errors
+
+def merge(prep: Dict[str, Any], raw_gdpr: Dict[str, Any], raw_ai: Dict[str, Any],
+          errors: Dict[str, str] = None) -> Dict[str, Any]:
+    errors = errors or {}
+    top_k = prep["top_k"]
+    lawchunks = prep["chunks_gdpr"] + prep["chunks_ai"]
 
     # 4) Merge deterministico
     violations: List[Dict[str, Any]] = []
@@ -148,6 +365,9 @@ def handle(payload: Dict[str, Any]) -> Dict[str, Any]:
         {"law": "GDPR",   "status": "found" if any(v.get("law")=="GDPR"   for v in violations) else "not_found", "notes": ""},
         {"law": "AI Act", "status": "found" if any(v.get("law")=="AI Act" for v in violations) else "not_found", "notes": ""},
     ]
+    for c in cov:
+        if c["law"] in errors:
+            c["notes"] = f"analysis unavailable ({errors[c['law']]})"
 
     merged = {
         "risk_score": risk_score,
@@ -155,8 +375,17 @@ def handle(payload: Dict[str, Any]) -> Dict[str, Any]:
         "recommendations": recs,
         "citations": cites,
         "law_coverage": cov,
-        "meta": {"top_k": top_k, "policies": ["gdpr","ai_act"], "pages": len(pages)},
+        "meta": {"top_k": top_k, "policies": ["gdpr","ai_act"], "pages": prep["pages"],
+                 "reading": prep.get("reading")},
     }
+    if errors:
+        merged["meta"]["partial"] = True
+        merged["meta"]["errors"] = errors
 
     # 5) Post-process finale
     return normalize_contract(merged, evidences=lawchunks)
+
+def handle(payload: Dict[str, Any]) -> Dict[str, Any]:
+    prep = prepare(payload)
+    raw_gdpr, raw_ai, errors = analyze(prep)
+    return merge(prep, raw_gdpr, raw_ai, errors)
@@ -1,6 +1,6 @@
 #from __future__ import annotations
 from typing import Dict, Any, List
-from ..retriever import retrieve_law_chunks
+from ..retriever import retrieve_many
 from ..legal_analyzer_gpt import legal_analyze_with_gpt, build_prompt
 from .postprocess import normalize_contract
 from ..config import POLICIES as DEFAULT_POLICIES, TOP_K as TOP_K_DEFAULT
@@ -12,17 +12,21 @@ except Exception:
 
 
 
-def handle(payload: Dict[str, Any]) -> Dict[str, Any]:
+def prepare(payload: Dict[str, Any]) -> Dict[str, Any]:
+    """Retrieval + prompt (fasi CPU): separate dalla chiamata LLM per il percorso asincrono."""
     assert payload.get("mode") == "free_text", "expects mode=free_text"
     user_text = (payload.get("user_text") or "").strip()
     top_k = int(payload.get("top_k", 12))
 
     k_ai = max(1, top_k // 2)
     k_gdpr = top_k - k_ai
-    law_chunks: List[Dict[str, Any]] = (
-        retrieve_law_chunks(user_text, ["ai_act"], top_k=k_ai)
-        + retrieve_law_chunks(user_text, ["gdpr"],   top_k=k_gdpr)
+    # stessa query per le due policy: un solo encode
+    hits = retrieve_many(
+        {"ai_act": user_text, "gdpr": user_text},
+        {"ai_act": ["ai_act"], "gdpr": ["gdpr"]},
+        top_k={"ai_act": k_ai, "gdpr": k_gdpr},
     )
+    law_chunks: List[Dict[str, Any]] = hits["ai_act"] + hits["gdpr"]
 
     # normalizza source
     def _norm_source(x: str) -> str:
@@ -33,8 +37,15 @@ def handle(payload: Dict[str, Any]) -> Dict[str, Any]:
     for ch in law_chunks:
         ch["source"] = _norm_source(ch.get("source","gdpr"))
 
-    prompt = build_prompt(user_text, law_chunks)
-    raw = legal_analyze_with_gpt(prompt, law_chunks, temperature=0.0, seed=42)
+    return {"prompt": build_prompt(user_text, law_chunks), "chunks": law_chunks}
+
+
+def finish(prep: Dict[str, Any], raw: Dict[str, Any]) -> Dict[str, Any]:
+    return normalize_contract(raw, evidences=prep["chunks"])
 
-    return normalize_contract(raw, evidences=law_chunks)
+
+def handle(payload: Dict[str, Any]) -> Dict[str, Any]:
+    prep = prepare(payload)
+    raw = legal_analyze_with_gpt(prep["prompt"], prep["chunks"], temperature=0.0, seed=42)
+    return finish(prep, raw)
 
@@ -2,6 +2,8 @@
 from __future__ import annotations
 from typing import Dict, Any, List
 import re
+from bisect import bisect_left
+from .signals import KeywordScanner
 
 # -----------------------------
 # Switch di comportamento
@@ -219,35 +221,55 @@ THEME_KEYWORDS = {
 def _tokenize_words(text: str) -> list[str]:
     return re.findall(r"\w+", text.lower(), flags=re.UNICODE)
 
-def _has_negation_near(text: str, keywords: list[str], window: int = NEGATION_WINDOW) -> bool:
-    neg_idxs = set()
-    for m in re.finditer("|".join(NEG_TOKENS), text.lower()):
-        neg_idxs.add(len(_tokenize_words(text[:m.start()])))
+_WORD_RE = re.compile(r"\w+", re.UNICODE)
+_NEG_RE = re.compile("|".join(NEG_TOKENS))
 
-    key_idxs = set()
-    for kw in keywords:
-        for m in re.finditer(kw, text.lower()):
-            key_idxs.add(len(_tokenize_words(text[:m.start()])))
+class _TextIndex:
+    """
+    Tokenizzazione unica di un testo (minuscolo): offset carattere → indice parola via bisect
+    sugli inizi parola, indici delle negazioni e, per ogni lista di keyword, indici degli hit.
+    Costruito una volta per risultato e condiviso da tutte le violazioni.
+    """
 
-    for ki in key_idxs:
-        for ni in neg_idxs:
-            if abs(ki - ni) <= window:
+    def __init__(self, text: str):
+        self.low = (text or "").lower()
+        self.starts = [m.start() for m in _WORD_RE.finditer(self.low)]
+        self.neg = sorted({self.word_at(m.start()) for m in _NEG_RE.finditer(self.low)})
+        self._kw: Dict[tuple, list] = {}
+
+    def word_at(self, pos: int) -> int:
+        # numero di parole che iniziano prima di pos (= len(_tokenize_words(text[:pos])))
+        return bisect_left(self.starts, pos)
+
+    def keyword_words(self, keywords) -> list:
+        key = tuple(keywords)
+        if key not in self._kw:
+            self._kw[key] = sorted({self.word_at(m.start()) for kw in key for m in re.finditer(kw, self.low)})
+        return self._kw[key]
+
+    def negation_near(self, keywords, window: int = NEGATION_WINDOW) -> bool:
+        neg = self.neg
+        for ki in self.keyword_words(keywords):
+            j = bisect_left(neg, ki - window)   # prima negazione non troppo a sinistra
+            if j < len(neg) and neg[j] <= ki + window:
                 return True
-    return False
+        return False
+
+def _has_negation_near(text: str, keywords: list[str], window: int = NEGATION_WINDOW,
+                       index: _TextIndex | None = None) -> bool:
+    return (index or _TextIndex(text)).negation_near(keywords, window)
+
+_THEME_SCANNER = KeywordScanner(THEME_KEYWORDS)
+_THEME_PRIORITY = ("biometric", "emotion", "profiling", "retention", "sharing_transfer")
 
 def _infer_theme(v: dict) -> str | None:
     t = (v.get("title") or "" + " " + v.get("reason", "") or "").lower()
-    if any(re.search(p, t) for p in THEME_KEYWORDS["biometric"]): return "biometric"
-    if any(re.search(p, t) for p in THEME_KEYWORDS["emotion"]): return "emotion"
-    if any(re.search(p, t) for p in THEME_KEYWORDS["profiling"]): return "profiling"
-    if any(re.search(p, t) for p in THEME_KEYWORDS["retention"]): return "retention"
-    if any(re.search(p, t) for p in THEME_KEYWORDS["sharing_transfer"]): return "sharing_transfer"
-    return None
+    return _THEME_SCANNER.first(t, _THEME_PRIORITY)
 
-def _covered_by_negation_in_evidence(user_evidence: str, theme: str) -> bool:
+def _covered_by_negation_in_evidence(user_evidence: str, theme: str, index: _TextIndex | None = None) -> bool:
     if not user_evidence or theme not in THEME_KEYWORDS:
         return False
-    return _has_negation_near(user_evidence, THEME_KEYWORDS[theme])
+    return _has_negation_near(user_evidence, THEME_KEYWORDS[theme], index=index)
 
 # -----------------------------
 # Article guard-rails (auto-correct)
@@ -276,12 +298,10 @@ THEME_ALIASES = {
     "conformity": ["conformity","assessment","valutazione conformità"],
     "transparency": ["transparency","inform","ai info","art.13","trasparenza","informazioni agli utenti"],
 }
+_ALIAS_SCANNER = KeywordScanner(THEME_ALIASES, literal=True)
+
 def _infer_theme_from_text(s: str) -> str | None:
-    s = (s or "").lower()
-    for theme, keys in THEME_ALIASES.items():
-        if any(k in s for k in keys):
-            return theme
-    return None
+    return _ALIAS_SCANNER.first((s or "").lower())
 
 # -----------------------------
 # Adapter: regole extra + avvisi
@@ -300,10 +320,13 @@ def enforce_rules(data: Dict[str, Any], max_citations: int | None = None, warn_c
 
     # A0) Negazioni (flag)
     ue = (data.get("user_text") or data.get("document_text") or "")
+    ue_index = None   # tokenizzazione del testo utente: una sola, condivisa tra le violazioni
     for v in out.get("violations", []) or []:
         theme = _infer_theme(v)
-        if theme and _covered_by_negation_in_evidence(ue, theme):
-            v["covered_by_negation"] = True
+        if theme and ue:
+            ue_index = ue_index or _TextIndex(ue)
+            if _covered_by_negation_in_evidence(ue, theme, ue_index):
+                v["covered_by_negation"] = True
 
     # A1) Article guard-rails (auto-correct) — deterministico, senza inferenza tema
     TRANSFER_PAT = re.compile(
@@ -0,0 +1,95 @@
+# tools/signals.py — scanner di keyword precompilato: una sola regex, un solo passaggio sul testo
+from __future__ import annotations
+from typing import Dict, Iterable, Iterator, List, Tuple
+import re
+
+
+class KeywordScanner:
+    """
+    Tabella {etichetta: [pattern regex]} compilata in un'unica alternanza con un gruppo
+    per etichetta: finditer() restituisce gli hit (start, end, etichetta) in ordine di testo.
+    Gli hit non si sovrappongono: a parità di posizione vince l'etichetta elencata prima.
+    found()/first() invece cercano ogni etichetta per conto suo (una regex per etichetta), così
+    un'etichetta non sparisce se un'altra ne consuma il testo ("accessoutside" → access + transfer).
+    literal=True tratta i pattern come stringhe (re.escape), come nei confronti `k in s`.
+    """
+
+    def __init__(self, table: Dict[str, Iterable[str]], flags: int = re.I, literal: bool = False):
+        self.labels = list(table)
+        alts, self._by_label = [], {}
+        for n, label in enumerate(self.labels):
+            pats = list(table[label])
+            if literal:
+                # stringhe più lunghe prima: a parità d'inizio lo hit copre la più ampia
+                pats = [re.escape(p) for p in sorted(pats, key=len, reverse=True)]
+            alts.append(f"(?P<k{n}>{'|'.join(pats)})")
+            self._by_label[label] = re.compile("|".join(pats), flags)
+        self.regex = re.compile("|".join(alts), flags)
+
+    def finditer(self, text: str) -> Iterator[Tuple[int, int, str]]:
+        for m in self.regex.finditer(text or ""):
+            yield m.start(), m.end(), self.labels[int(m.lastgroup[1:])]
+
+    def hits(self, text: str) -> List[Tuple[int, int, str]]:
+        return list(self.finditer(text))
+
+    def count(self, text: str) -> int:
+        return sum(1 for _ in self.regex.finditer(text or ""))
+
+    def found(self, text: str) -> set:
+        """Etichette presenti nel testo (anche se sovrapposte a quelle di altre etichette)."""
+        return {l for l, rx in self._by_label.items() if rx.search(text or "")}
+
+    def first(self, text: str, order: Iterable[str] = None) -> str | None:
+        """Prima etichetta presente secondo `order` (default: ordine della tabella); si ferma lì."""
+        return next((l for l in (order or self.labels) if self._by_label[l].search(text or "")), None)
+
+
+# frasi/righe: stessi separatori di re.split(r'(?<=[\.\?!])\s+|\n+', text)
+_SENT_SEP = re.compile(r"(?<=[\.\?!])\s+|\n+")
+
+def signal_lines(text: str, scanner: KeywordScanner, max_lines: int = 20) -> List[str]:
+    """
+    Frasi che contengono almeno uno hit, deduplicate (case-insensitive) in ordine di testo.
+    La regex salta direttamente alla prossima frase candidata; se lo hit scavalca un separatore
+    la frase viene ricontrollata da sola (pos/endpos), come faceva re.search sulla riga divisa.
+    Interrotto a max_lines frasi.
+    """
+    text = text or ""
+    seps = _SENT_SEP.finditer(text)
+    start, nxt = 0, next(seps, None)          # frase corrente: text[start:nxt.start()]
+    seen, out, pos = set(), [], 0
+    while len(out) < max_lines:
+        m = scanner.regex.search(text, pos)
+        if m is None:
+            break
+        while nxt is not None and nxt.end() <= m.start():
+            start, nxt = nxt.end(), next(seps, None)
+        end = nxt.start() if nxt is not None else len(text)
+        pos = nxt.end() if nxt is not None else len(text)
+        if m.end() > end and scanner.regex.search(text, start, end) is None:
+            continue                          # keyword spezzata dal separatore: nessuno hit intero
+        line = text[start:end].strip()
+        k = line.lower()
+        if line and k not in seen:
+            out.append(line)
+            seen.add(k)
+    return out
+
+
+GDPR_KEYWORDS = [
+    r"consent", r"lawful", r"legal\s+basis", r"art\.?\s*5", r"art\.?\s*6", r"art\.?\s*9", r"art\.?\s*13",
+    r"art\.?\s*14", r"art\.?\s*22", r"dpia", r"data\s+minimi[sz]ation", r"personal\s+data",
+    r"data\s+subject", r"profiling", r"automated\s+decision",
+]
+AI_ACT_KEYWORDS = [
+    r"artificial\s+intelligence", r"\bai\s+(?:system|model|tool)s?", r"machine\s+learning", r"\bllms?\b",
+    r"general[-\s]purpose", r"high[-\s]risk", r"human\s+oversight", r"biometric", r"emotion\s+recognition",
+    r"robustness", r"conformity\s+assessment", r"annex\s+iii", r"art\.?\s*(?:5|10|13|14|15|50)\b",
+    r"chatbot", r"deepfake",
+]
+
+GDPR_SIGNALS = KeywordScanner({"gdpr": GDPR_KEYWORDS})
+AI_ACT_SIGNALS = KeywordScanner({"ai_act": AI_ACT_KEYWORDS})
+# entrambe le leggi in un solo passaggio (densità dei segnali per chunk)
+LAW_SIGNALS = KeywordScanner({"gdpr": GDPR_KEYWORDS, "ai_act": AI_ACT_KEYWORDS})
@@ -8,6 +8,50 @@ sys.path.insert(0, str(ROOT))   # rende importabile `tools/` e il resto del prog
 
 FIX = ROOT / "tests" / "fixtures"
 
+# i test non leggono/scrivono le cache persistenti di runtime (i test di cache le riattivano su tmp_path)
+os.environ.setdefault("LEXIE_LLM_CACHE", "0")
+os.environ.setdefault("LEXIE_RESULT_CACHE", "0")
+
+class StubOpenAI:
+    """Client OpenAI finto (nessuna rete): risponde in base al seed (42 = GDPR, 43 = AI Act)."""
+    calls = []
+    delay = 0.0
+    fail_seeds = set()
+    slow_seeds = {}
+    hang_seeds = set()
+
+    def __init__(self, **kw):
+        self.chat = self
+        self.completions = self
+
+    def create(self, model, messages, temperature, seed, **kw):
+        self.calls.append(seed)
+        if seed in self.hang_seeds:
+            # server appeso: la richiesta finisce solo allo scadere del timeout HTTP del tentativo
+            time.sleep(kw.get("timeout") or 0)
+            raise TimeoutError("stub read timeout")
+        time.sleep(self.slow_seeds.get(seed, self.delay))
+        if seed in self.fail_seeds:
+            raise ConnectionError("stub down")
+        law = "GDPR" if seed == 42 else "AI Act"
+        body = {"risk_score": 40 if seed == 42 else 70,
+                "violations": [{"law": law, "article": "Art. 13", "title": "Transparency", "reason": "x"}],
+                "recommendations": [f"fix {law}"], "citations": []}
+        msg = type("M", (), {"content": json.dumps(body)})
+        return type("R", (), {"choices": [type("C", (), {"message": msg})]})
+
+@pytest.fixture
+def openai_stub(monkeypatch):
+    from lexie import legal_analyzer_gpt
+    monkeypatch.setenv("OPENAI_API_KEY", "sk-test")
+    monkeypatch.setattr(legal_analyzer_gpt, "OpenAI", StubOpenAI)
+    for name, value in (("calls", []), ("delay", 0.0), ("fail_seeds", set()), ("slow_seeds", {}),
+                        ("hang_seeds", set())):
+        monkeypatch.setattr(StubOpenAI, name, value)
+    legal_analyzer_gpt.reset_clients()
+    yield StubOpenAI
+    legal_analyzer_gpt.reset_clients()
+
 @pytest.fixture(scope="session")
 def fixtures_dir():
     return FIX
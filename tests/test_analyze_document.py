@@ -0,0 +1,114 @@
+# test_analyze_document.py
+# Pipeline documento con client OpenAI stub locale (nessuna rete)
+import time
+import pytest
+from lexie.tools import analyze_document
+
+DELAY = 0.3
+
+@pytest.fixture(scope="module")
+def prep(fixtures_dir):
+    # estrazione PDF una sola volta per modulo
+    return analyze_document.prepare({"mode": "document", "document_path": str(fixtures_dir / "info_breve.pdf"), "top_k": 4})
+
+@pytest.fixture
+def stub(openai_stub, monkeypatch, fixtures_dir):
+    monkeypatch.setattr(openai_stub, "delay", DELAY)
+    return {"mode": "document", "document_path": str(fixtures_dir / "info_breve.pdf"), "top_k": 4}
+
+def test_gdpr_and_ai_calls_run_concurrently(stub, prep):
+    t0 = time.perf_counter()
+    raw_gdpr, raw_ai, errors = analyze_document.analyze(prep)
+    assert time.perf_counter() - t0 < 2 * DELAY
+    assert not errors
+    out = analyze_document.merge(prep, raw_gdpr, raw_ai, errors)
+    assert [v["law"] for v in out["violations"]] == ["GDPR", "AI Act"]
+    assert out["risk_score"] == 70 and "partial" not in out["meta"]
+
+def test_one_side_failing_returns_partial_result(stub, openai_stub):
+    openai_stub.fail_seeds = {43}
+    out = analyze_document.handle(stub)
+    assert [v["law"] for v in out["violations"]] == ["GDPR"]
+    assert out["meta"]["partial"] and "AI Act" in out["meta"]["errors"]
+
+def test_per_law_timeout(stub, openai_stub, prep):
+    openai_stub.slow_seeds = {42: 0.01, 43: 2.0}
+    raw_gdpr, raw_ai, errors = analyze_document.analyze(prep, timeout=0.5)
+    assert raw_gdpr["risk_score"] == 40 and raw_ai == {}
+    assert errors["AI Act"].startswith("TimeoutError")
+
+def test_timed_out_call_releases_its_pool_thread(stub, openai_stub, prep, monkeypatch):
+    # LLM_REQUEST_TIMEOUT×retry supererebbe di molto il timeout: la scadenza ferma tentativi e backoff
+    from concurrent.futures import ThreadPoolExecutor
+    from lexie import legal_analyzer_gpt
+    monkeypatch.setattr(legal_analyzer_gpt, "_RETRYABLE", (TimeoutError,))   # come APITimeoutError
+    openai_stub.hang_seeds = {43}
+    pool = ThreadPoolExecutor(max_workers=2)
+    raw_gdpr, raw_ai, errors = analyze_document.analyze(prep, timeout=0.5, executor=pool)
+    assert raw_gdpr and raw_ai == {} and errors["AI Act"].startswith("TimeoutError")
+    t0 = time.perf_counter()
+    pool.shutdown(wait=True)
+    assert time.perf_counter() - t0 < 0.5
+
+def test_both_failing_raises(stub, openai_stub, prep):
+    openai_stub.fail_seeds = {42, 43}
+    with pytest.raises(RuntimeError):
+        analyze_document.analyze(prep)
+
+def test_streaming_chunks_match_full_text():
+    pages = ["First page. " * 40, "Second page without stops " * 30, "", "Last. " * 90]
+    full = "\n\n".join(pages)
+    streamed = analyze_document._merge_small(list(analyze_document._iter_chunks(pages, 50, 10)), 20)
+    assert streamed == analyze_document._chunk_by_tokens(full, 50, 10, 20)
+
+def test_prepare_stops_reading_at_text_cap(monkeypatch, fixtures_dir):
+    read = []
+    real = analyze_document.iter_file_pages
+
+    def counting(path, **kw):
+        for p in real(path, **kw):
+            read.append(p["page"])
+            yield p
+
+    monkeypatch.setattr(analyze_document, "iter_file_pages", counting)
+    monkeypatch.setattr(analyze_document, "USER_TEXT_CAP", 3000)
+    prep = analyze_document.prepare({"mode": "document", "document_path": str(fixtures_dir / "dpa_bozza.pdf"), "top_k": 4})
+    assert prep["pages"] == len(read) < 10
+
+def test_spread_order_samples_ends_then_middle():
+    assert analyze_document._spread_order(9) == [0, 8, 4, 2, 6, 1, 3, 5, 7]
+    assert analyze_document._spread_order(1) == [0]
+
+@pytest.mark.parametrize("strategy", ["first_n", "signal_dense", "spread"])
+def test_read_strategies_report_coverage(monkeypatch, fixtures_dir, strategy):
+    monkeypatch.setattr(analyze_document, "USER_TEXT_CAP", 4000)
+    monkeypatch.setattr(analyze_document, "DOC_SCAN_CAP", 12000)
+    prep = analyze_document.prepare({"mode": "document", "document_path": str(fixtures_dir / "dpa_bozza.pdf"),
+                                     "top_k": 4, "read_strategy": strategy})
+    r = prep["reading"]
+    assert r["strategy"] == strategy and not r["complete"]
+    assert 0 < r["pages_read"] < r["pages_total"] == 33
+    assert r["chars_used"] <= 4000 <= r["chars_read"]
+
+def test_spread_reads_both_ends(fixtures_dir):
+    pages, raw, complete = analyze_document._read_spread(fixtures_dir / "dpa_bozza.pdf", 4000)
+    nums = [p["page"] for p in pages]
+    assert nums == sorted(nums) and nums[0] == 1 and nums[-1] == 33
+    assert any(pages[-1]["text"][:40] in c for c in raw) and not complete
+
+@pytest.mark.parametrize("strategy", ["first_n", "signal_dense", "spread"])
+def test_pages_total_without_second_parse(monkeypatch, fixtures_dir, strategy):
+    if strategy != "spread":
+        monkeypatch.setattr(analyze_document, "page_count", lambda p: pytest.fail("page tree parsed twice"))
+    monkeypatch.setattr(analyze_document, "USER_TEXT_CAP", 4000)
+    prep = analyze_document.prepare({"mode": "document", "document_path": str(fixtures_dir / "dpa_bozza.pdf"),
+                                     "top_k": 4, "read_strategy": strategy})
+    assert prep["reading"]["pages_total"] == 33
+
+@pytest.mark.parametrize("strategy", ["first_n", "signal_dense", "spread"])
+def test_non_pdf_input_degrades_to_empty_text(tmp_path, strategy):
+    doc = tmp_path / "notes.pdf"
+    doc.write_text("just some text, not a PDF", encoding="utf-8")
+    prep = analyze_document.prepare({"mode": "document", "document_path": str(doc), "top_k": 4,
+                                     "read_strategy": strategy})
+    assert prep["pages"] == 0 and prep["reading"]["pages_total"] == 0
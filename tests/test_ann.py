@@ -0,0 +1,37 @@
+# test_ann.py
+# IVF: recall con nprobe pieno = ricerca esatta, persistenza
+import numpy as np
+from lexie.ann import IVFIndex
+
+def _data(n=600, d=16, seed=1):
+    x = np.random.default_rng(seed).normal(size=(n, d)).astype(np.float32)
+    return x / np.linalg.norm(x, axis=1, keepdims=True)
+
+def test_full_probe_is_exact():
+    x = _data()
+    idx = IVFIndex.build(x, n_lists=12)
+    assert sorted(idx.members.tolist()) == list(range(len(x)))
+    q = x[17]
+    assert idx.probe(q, nprobe=12).tolist() == list(range(len(x)))
+    assert 17 in idx.probe(q, nprobe=1)
+
+def test_recall_grows_with_nprobe():
+    x = _data()
+    idx = IVFIndex.build(x, n_lists=24)
+    qs = _data(50, seed=2)
+    def recall(nprobe):
+        hit = 0
+        for q in qs:
+            true = set(np.argsort(-(x @ q))[:5].tolist())
+            cand = idx.probe(q, nprobe)
+            top = cand[np.argsort(-(x[cand] @ q))[:5]]
+            hit += len(true & set(top.tolist()))
+        return hit / (5 * len(qs))
+    assert recall(1) <= recall(6) <= recall(24) == 1.0
+
+def test_roundtrip(tmp_path):
+    idx = IVFIndex.build(_data(100), model="m", source_sha1="s")
+    idx.save(tmp_path)
+    back = IVFIndex.load(tmp_path)
+    assert (back.model, back.source_sha1, back.n_lists) == ("m", "s", idx.n_lists)
+    assert (back.members == idx.members).all()
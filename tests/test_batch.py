@@ -0,0 +1,59 @@
+# test_batch.py
+# Batch runner: un JSON per documento, summary.csv, resume dopo interruzione (LLM stub, nessuna rete)
+import csv
+import json
+import shutil
+import pytest
+from lexie import batch
+from lexie.tools import analyze_document
+
+@pytest.fixture
+def docs(tmp_path, fixtures_dir, monkeypatch, openai_stub):
+    monkeypatch.setattr(batch, "RESULT_CACHE_ENABLED", False)
+    src = tmp_path / "in"
+    (src / "vendors").mkdir(parents=True)
+    shutil.copy(fixtures_dir / "info_breve.pdf", src / "a.pdf")
+    shutil.copy(fixtures_dir / "iubenda.pdf", src / "vendors" / "b.pdf")
+    return src
+
+def _summary(out):
+    with open(out / "summary.csv", newline="", encoding="utf-8") as f:
+        return list(csv.DictReader(f))
+
+def test_batch_writes_results_and_resumes(docs, tmp_path, openai_stub):
+    out = tmp_path / "out"
+    found = batch.discover(docs)
+    assert [p.name for p in found] == ["a.pdf", "b.pdf"]
+
+    rows = batch.BatchRunner(out, workers=0, llm_concurrency=2).run(found)
+    assert [r["status"] for r in rows] == ["ok", "ok"] and len(openai_stub.calls) == 4
+    res = json.loads(batch.result_file(out, found[0]).read_text(encoding="utf-8"))
+    assert res["risk_score"] == 70 and res["_meta"]["fingerprint"]
+    assert [r["violations_gdpr"] for r in _summary(out)] == ["1", "1"]
+
+    # "interruzione": un risultato manca → solo quel documento viene rianalizzato
+    batch.result_file(out, found[1]).unlink()
+    rows = batch.BatchRunner(out, workers=0).run(found)
+    assert [r["status"] for r in rows] == ["skipped", "ok"] and len(openai_stub.calls) == 6
+    assert len(_summary(out)) == 2
+
+def test_manifest_and_missing_files(docs, tmp_path):
+    manifest = docs / "list.txt"
+    manifest.write_text("# vendor DPAs\na.pdf\nmissing.pdf\n", encoding="utf-8")
+    found = batch.discover(manifest)
+    rows = batch.BatchRunner(tmp_path / "out", workers=0).run(found)
+    assert [r["status"] for r in rows] == ["ok", "error"]
+    assert rows[1]["error"] == "file not found"
+
+def test_process_pool_prepare_and_batch_llm_pool(docs, tmp_path, openai_stub, monkeypatch):
+    # prepare nei processi worker (spawn); le 2×llm_concurrency chiamate LLM partono insieme sul pool del batch
+    openai_stub.delay = 0.1
+    monkeypatch.setattr(analyze_document, "_LLM_POOL", None)   # il pool condiviso non va usato
+    methods, real = [], batch.ProcessPoolExecutor
+    monkeypatch.setattr(batch, "ProcessPoolExecutor",
+                        lambda *a, **kw: methods.append(kw["mp_context"].get_start_method()) or real(*a, **kw))
+    rows = batch.BatchRunner(tmp_path / "out", workers=1, llm_concurrency=2, timeout=2).run(batch.discover(docs))
+    assert [r["status"] for r in rows] == ["ok", "ok"]
+    assert [r["partial"] for r in rows] == [False, False]
+    assert [r["pages_total"] for r in rows] == [33, 33] and len(openai_stub.calls) == 4
+    assert methods == ["spawn"]
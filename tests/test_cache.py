@@ -0,0 +1,20 @@
+# test_cache.py
+# Cache SQLite: TTL, eviction per dimensione (LRU), chiavi content-addressed
+import time
+from lexie.cache import SQLiteCache, content_key
+
+def test_ttl_and_size_eviction(tmp_path, monkeypatch):
+    c = SQLiteCache(tmp_path / "c.sqlite", ttl_s=100, max_entries=2)
+    now = [1000.0]
+    monkeypatch.setattr(time, "time", lambda: now[0])
+    c.set("a", {"v": 1}); now[0] += 1
+    c.set("b", {"v": 2}); now[0] += 1
+    assert c.get("a") == {"v": 1}; now[0] += 1   # "a" ora è la più recente
+    c.set("c", {"v": 3})
+    assert c.get("b") is None and len(c) == 2 and c.evictions == 1
+    now[0] += 500
+    assert c.get("a") is None                    # scaduta
+
+def test_content_key_is_stable():
+    assert content_key("m", "p", 42, 0.0) == content_key("m", "p", 42, 0.0)
+    assert content_key("m", "p", 42, 0.0) != content_key("m", "p", 43, 0.0)
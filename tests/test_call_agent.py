@@ -0,0 +1,113 @@
+# test_call_agent.py
+# Cache dei risultati completi: hit sul secondo route, invalidazione al rebuild degli indici;
+# aroute: limite alle chiamate LLM concorrenti (client async stub)
+import asyncio
+import json
+import os
+import pytest
+from lexie import call_agent, legal_analyzer_gpt, retriever
+from lexie.cache import SQLiteCache
+from lexie.tools import analyze_document
+
+@pytest.fixture
+def agent(tmp_path, monkeypatch):
+    pol = tmp_path / "policies"
+    for name in ("gdpr", "ai_act"):
+        (pol / name).mkdir(parents=True)
+        (pol / name / "chunks.jsonl").write_text(
+            json.dumps({"id": f"{name}.pdf::p1", "text": "consent", "page": 1}) + "\n", encoding="utf-8")
+    monkeypatch.setattr(retriever, "POLICY_DIR", pol)
+    monkeypatch.setattr(call_agent, "LOG_DIR", tmp_path)
+    monkeypatch.setattr(call_agent, "RESULT_CACHE_ENABLED", True)
+    monkeypatch.setattr(call_agent, "_RESULT_CACHE", SQLiteCache(tmp_path / "results.sqlite"))
+    calls = []
+
+    def fake_free_text(payload):
+        calls.append(payload["user_text"])
+        return {"summary": "ok", "risk_score": 40, "meta": {}}
+
+    monkeypatch.setattr(call_agent, "analyze_free_text", fake_free_text)
+    return pol, calls
+
+def test_second_route_is_served_from_cache(agent):
+    _, calls = agent
+    first = call_agent.route({"mode": "free_text", "user_text": "We  process consent."})
+    second = call_agent.route({"mode": "free_text", "user_text": "We process consent."})
+    assert len(calls) == 1
+    assert second["summary"] == first["summary"] and second["risk_level"] == first["risk_level"]
+    assert second["_meta"]["cached"] is True and "cached" not in first["_meta"]
+
+    call_agent.route({"mode": "free_text", "user_text": "We process consent.", "no_cache": True})
+    assert len(calls) == 2
+
+def test_index_rebuild_invalidates(agent):
+    pol, calls = agent
+    payload = {"mode": "free_text", "user_text": "biometric data"}
+    call_agent.route(payload)
+    f = pol / "gdpr" / "chunks.jsonl"
+    st = f.stat()
+    os.utime(f, ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))
+    call_agent.route(payload)
+    assert len(calls) == 2
+
+class StubAsyncOpenAI:
+    """AsyncOpenAI finto: misura quante chiamate sono in volo insieme."""
+    active = peak = 0
+    delay = 0.05
+
+    def __init__(self, **kw):
+        self.chat = self
+        self.completions = self
+
+    async def create(self, model, messages, temperature, seed, **kw):
+        cls = StubAsyncOpenAI
+        cls.active += 1
+        cls.peak = max(cls.peak, cls.active)
+        await asyncio.sleep(cls.delay)
+        cls.active -= 1
+        law = "GDPR" if seed == 42 else "AI Act"
+        body = {"risk_score": 50, "recommendations": [], "citations": [],
+                "violations": [{"law": law, "article": "Art. 13", "title": "Transparency", "reason": "x"}]}
+        msg = type("M", (), {"content": json.dumps(body)})
+        return type("R", (), {"choices": [type("C", (), {"message": msg})]})
+
+@pytest.fixture
+def async_llm(tmp_path, monkeypatch):
+    monkeypatch.setenv("OPENAI_API_KEY", "sk-test")
+    monkeypatch.setattr(legal_analyzer_gpt, "AsyncOpenAI", StubAsyncOpenAI)
+    monkeypatch.setattr(legal_analyzer_gpt, "LLM_ASYNC_CONCURRENCY", 3)
+    monkeypatch.setattr(StubAsyncOpenAI, "peak", 0)
+    monkeypatch.setattr(StubAsyncOpenAI, "delay", 0.05)
+    monkeypatch.setattr(call_agent, "LOG_DIR", tmp_path)
+    legal_analyzer_gpt.reset_clients()
+    yield
+    legal_analyzer_gpt.reset_clients()
+
+def test_aroute_limits_concurrent_llm_calls(async_llm):
+    async def main():
+        payloads = [{"mode": "free_text", "user_text": f"We profile users with AI, case {i}."} for i in range(10)]
+        return await asyncio.gather(*(call_agent.aroute(p) for p in payloads))
+
+    results = asyncio.run(main())
+    assert len(results) == 10 and all(r["risk_level"] == "medium" for r in results)
+    assert StubAsyncOpenAI.peak == 3
+
+def test_aroute_document_runs_both_laws(async_llm, fixtures_dir):
+    payload = {"mode": "document", "document_path": str(fixtures_dir / "info_breve.pdf"), "top_k": 4}
+    result = asyncio.run(call_agent.aroute(payload))
+    assert {v["law"] for v in result["violations"]} == {"GDPR", "AI Act"}
+    assert not result["meta"].get("partial") and result["meta"]["reading"]["pages_read"] >= 1
+
+def test_aanalyze_timeout_starts_after_the_semaphore(async_llm, monkeypatch, fixtures_dir):
+    # 1 chiamata alla volta, 6 chiamate da 0.1s: in coda fino a 0.5s, ma ognuna sta nel timeout di 0.25s
+    monkeypatch.setattr(legal_analyzer_gpt, "LLM_ASYNC_CONCURRENCY", 1)
+    monkeypatch.setattr(StubAsyncOpenAI, "delay", 0.1)
+    preps = [analyze_document.prepare({"mode": "document", "document_path": str(fixtures_dir / name), "top_k": 4})
+             for name in ("info_breve.pdf", "iubenda.pdf", "dpa_bozza.pdf")]
+
+    async def main():
+        return await asyncio.gather(*(analyze_document.aanalyze(p, timeout=0.25) for p in preps))
+
+    outs = asyncio.run(main())
+    assert StubAsyncOpenAI.peak == 1
+    assert all(not errors and raw_gdpr and raw_ai for raw_gdpr, raw_ai, errors in outs)
@@ -0,0 +1,42 @@
+# test_chunker.py
+# Chunker a span: stesso output dell'implementazione precedente (benchmarks/bench_chunker.py), anche in streaming
+import random
+import pytest
+from lexie import tokens
+from lexie.tools import analyze_document as ad
+from benchmarks.bench_chunker import legacy_chunk_by_tokens, synthetic_text
+
+@pytest.fixture(autouse=True)
+def heuristic():
+    tokens.set_counter(tokens.CharHeuristic())
+    yield
+    tokens.set_counter(None)
+
+def _random_texts(n=200, seed=7):
+    rng = random.Random(seed)
+    return ["".join(rng.choice("ab  .!?\n") for _ in range(rng.randint(0, 5000))) for _ in range(n)]
+
+@pytest.mark.parametrize("params", [(350, 60, 200), (50, 10, 20), (10, 9, 5), (8, 0, 1)])
+def test_matches_legacy_output(params):
+    for text in _random_texts() + [synthetic_text(60000)]:
+        assert ad._chunk_by_tokens(text, *params) == legacy_chunk_by_tokens(text, *params)
+
+def test_streamed_pages_match_whole_text():
+    rng = random.Random(3)
+    text = synthetic_text(40000, seed=3)
+    pages, a = [], 0
+    while a < len(text):
+        b = a + rng.randint(0, 3000)
+        pages.append(text[a:b])
+        a = b + 2
+    full = "\n\n".join(pages)
+    streamed = ad._merge_small(list(ad._iter_chunks(pages, 100, 20)), 50)
+    assert streamed == ad._chunk_by_tokens(full, 100, 20, 50)
+
+def test_spans_index_the_original_text():
+    text = "  " + synthetic_text(20000, seed=5) + "  "
+    spans = ad.chunk_spans(text, 100, 20)
+    chunks = list(ad._iter_chunks([text], 100, 20))
+    assert [text[a:b] for a, b in spans] == chunks
+    assert all(a < b and not text[a].isspace() and not text[b - 1].isspace() for a, b in spans)
+    assert spans[-1][1] == len(text) - 2
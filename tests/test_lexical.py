@@ -0,0 +1,29 @@
+# test_lexical.py
+# BM25: tokenizer condiviso, riferimenti agli articoli, persistenza
+from lexie.lexical import BM25Index, tokenize
+
+DOCS = [
+    "Transfers of personal data to third countries subject to appropriate safeguards (Art. 46).",
+    "The controller shall implement appropriate technical measures for security of processing.",
+    "High-risk AI systems listed in Annex III shall comply with the requirements.",
+    "Article 8 sets conditions applicable to child's consent.",
+]
+
+def test_tokenize_article_references():
+    toks = tokenize("See Art. 46 and Annex III, Article 8, considerando 26")
+    assert "art:46" in toks and "annex:iii" in toks and "art:8" in toks and "recital:26" in toks
+    assert "see" in toks
+
+def test_bm25_ranks_article_number():
+    idx = BM25Index.build(DOCS)
+    s = idx.scores("transfers under Art. 46")
+    assert int(s.argmax()) == 0
+    assert int(idx.scores("annex III high-risk").argmax()) == 2
+    assert not idx.scores("zzz").any()
+
+def test_bm25_roundtrip(tmp_path):
+    idx = BM25Index.build(DOCS, source_sha1="abc")
+    idx.save(tmp_path)
+    back = BM25Index.load(tmp_path)
+    assert back.source_sha1 == "abc" and len(back) == len(DOCS)
+    assert (back.scores("child consent") == idx.scores("child consent")).all()
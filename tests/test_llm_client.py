@@ -0,0 +1,88 @@
+# test_llm_client.py
+# Client OpenAI condiviso contro un server stub locale compatibile OpenAI
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pytest
+from lexie import legal_analyzer_gpt as lag
+
+ANSWER = {"risk_score": 20, "violations": [], "recommendations": ["ok"], "citations": []}
+
+class _Stub(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive
+    fail_first = 0
+    calls = 0
+    peers = set()
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        cls = type(self)
+        cls.calls += 1
+        cls.peers.add(self.client_address)
+        if cls.calls <= cls.fail_first:
+            return self._send(503, {"error": {"message": "busy", "type": "server_error"}})
+        req = json.loads(body)
+        self._send(200, {
+            "id": "cmpl-stub", "object": "chat.completion", "created": 0, "model": req["model"],
+            "choices": [{"index": 0, "finish_reason": "stop",
+                         "message": {"role": "assistant", "content": json.dumps(ANSWER)}}],
+        })
+
+    def _send(self, code, obj):
+        raw = json.dumps(obj).encode("utf-8")
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(raw)))
+        self.end_headers()
+        self.wfile.write(raw)
+
+    def log_message(self, *a):
+        pass
+
+@pytest.fixture
+def server(monkeypatch):
+    if lag.OpenAI is None:
+        pytest.skip("openai not installed")
+    _Stub.calls, _Stub.fail_first, _Stub.peers = 0, 0, set()
+    srv = ThreadingHTTPServer(("127.0.0.1", 0), _Stub)
+    threading.Thread(target=srv.serve_forever, daemon=True).start()
+    monkeypatch.setenv("OPENAI_API_KEY", "sk-stub")
+    monkeypatch.setattr(lag, "LLM_BASE_URL", f"http://127.0.0.1:{srv.server_port}/v1")
+    monkeypatch.setattr(lag, "LLM_BACKOFF_BASE", 0.01)
+    lag.reset_clients()
+    yield _Stub
+    lag.reset_clients()
+    srv.shutdown()
+
+def test_client_is_reused_with_keepalive(server):
+    for _ in range(3):
+        out = lag.legal_analyze_with_gpt("prompt", [])
+        assert out["recommendations"] == ["ok"]
+    assert server.calls == 3
+    assert len(server.peers) == 1  # una sola connessione TCP
+    assert len(lag._CLIENTS) == 1
+
+def test_retries_transient_errors(server):
+    server.fail_first = 2
+    out = lag.legal_analyze_with_gpt("prompt", [])
+    assert out["risk_score"] == 20 and server.calls == 3
+
+def test_gives_up_after_max_retries(server, monkeypatch):
+    monkeypatch.setattr(lag, "LLM_MAX_RETRIES", 1)
+    server.fail_first = 5
+    with pytest.raises(lag.openai.InternalServerError):
+        lag.legal_analyze_with_gpt("prompt", [])
+    assert server.calls == 2
+
+def test_response_cache_hit_and_bypass(server, monkeypatch, tmp_path):
+    from lexie.cache import SQLiteCache
+    monkeypatch.setattr(lag, "LLM_CACHE_ENABLED", True)
+    monkeypatch.setattr(lag, "_LLM_CACHE", SQLiteCache(tmp_path / "llm.sqlite", ttl_s=3600, max_entries=10))
+    a = lag.legal_analyze_with_gpt("same prompt", [], seed=42)
+    b = lag.legal_analyze_with_gpt("same prompt", [], seed=42)
+    assert a == b and server.calls == 1
+    lag.legal_analyze_with_gpt("same prompt", [], seed=43)           # seed diverso → chiave diversa
+    lag.legal_analyze_with_gpt("same prompt", [], seed=42, use_cache=False)
+    lag.legal_analyze_with_gpt("same prompt", [], temperature=0.7)   # non deterministica: mai in cache
+    assert server.calls == 4
+    assert lag.get_llm_cache().stats()["hits"] == 1
@@ -0,0 +1,43 @@
+# test_loaders.py
+# Estrazione PDF: parallela per range di pagine == seriale (stesso ordine e stessa pulizia)
+import pytest
+from lexie import loaders
+
+def test_parallel_extraction_matches_serial(fixtures_dir, monkeypatch):
+    pdf = fixtures_dir / "dpa_bozza.pdf"
+    serial = loaders.load_file_text(pdf, workers=1)
+    monkeypatch.setattr(loaders, "PDF_PARALLEL_MIN_PAGES", 4)
+    parallel = loaders.load_file_text(pdf, workers=3)
+    assert len(serial) > 10
+    assert parallel == serial
+
+def test_page_range_keeps_page_numbers(fixtures_dir):
+    pdf = fixtures_dir / "dpa_bozza.pdf"
+    pages = loaders._extract_range(str(pdf), 3, 6)
+    assert [p["page"] for p in pages] == [4, 5, 6]
+    assert pages == loaders.load_file_text(pdf, workers=1)[3:6]
+
+def test_parallel_ranges_are_submitted_lazily(fixtures_dir, monkeypatch):
+    # chi legge solo l'inizio non paga l'estrazione dell'intero documento
+    submitted = []
+    real = loaders._get_pool
+
+    class Counting:
+        def __init__(self, pool):
+            self.pool = pool
+
+        def submit(self, fn, path, a, b):
+            submitted.append(a)
+            return self.pool.submit(fn, path, a, b)
+
+    monkeypatch.setattr(loaders, "_get_pool", lambda w: Counting(real(w)))
+    monkeypatch.setattr(loaders, "PDF_PARALLEL_MIN_PAGES", 4)
+    gen = loaders.iter_file_pages(fixtures_dir / "dpa_bozza.pdf", workers=2)
+    first = next(gen)
+    gen.close()
+    assert first["page"] == 1
+    assert len(submitted) == 3          # 2 in volo + 1 inviato al consumo del primo range (su 7)
+
+def test_default_is_serial(fixtures_dir, monkeypatch):
+    monkeypatch.setattr(loaders, "_get_pool", lambda w: pytest.fail("pool used by default"))
+    assert len(loaders.load_file_text(fixtures_dir / "dpa_bozza.pdf")) > 10
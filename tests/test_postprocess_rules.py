@@ -60,3 +60,32 @@ def test_max_citations_cap_if_configured():
     assert len(data_out["citations"]) <= 3, "Cap citazioni non rispettato"
     # Le violazioni restano intatte
     assert len(data_out["violations"]) == 2
+
+def test_negation_index_matches_prefix_tokenization():
+    from tools.postprocess import _TextIndex, _tokenize_words
+    text = "We do NOT share data; l'azienda non trasferisce i dati."
+    idx = _TextIndex(text)
+    for pos in range(len(text) + 1):
+        assert idx.word_at(pos) == len(_tokenize_words(text[:pos]))
+    assert idx.negation_near([r"\bshare"], window=1)
+    assert not idx.negation_near([r"\bdati"], window=1)
+    assert idx.negation_near([r"\bdati"], window=3)
+
+def test_negation_flag_shares_one_index(monkeypatch):
+    """Il testo utente viene tokenizzato una volta sola per tutte le violazioni."""
+    from tools import postprocess
+    built = []
+    real = postprocess._TextIndex
+    monkeypatch.setattr(postprocess, "_TextIndex", lambda t: built.append(t) or real(t))
+    data_in = _mk_sample(
+        violations=[
+            {"law": "AI Act", "article": "5", "title": "Facial recognition", "reason": "x"},
+            {"law": "GDPR", "article": "22", "title": "Profiling of users", "reason": "y"},
+        ],
+        citations=[],
+    )
+    data_in["user_text"] = ("We never use facial recognition. " + "Other unrelated policy words here. " * 4
+                            + "Users are profiled for marketing.")
+    data_out, _ = enforce_rules(data_in)
+    flags = [v.get("covered_by_negation", False) for v in data_out["violations"]]
+    assert flags == [True, False] and len(built) == 1
@@ -0,0 +1,56 @@
+# test_reports.py
+# Report PDF in background: handle di stato, scrittura atomica, route(background_pdf=True)
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+from lexie import call_agent, reports
+
+RESULT = {"risk_score": 72, "risk_level": "high", "summary": "Profiling without a legal basis.",
+          "violations": [{"law": "GDPR", "article": "Art. 22", "title": "Automated decisions", "reason": "x"}],
+          "recommendations": ["Add human review."], "citations": [{"source": "gdpr", "page": 46, "id": "gdpr.pdf::p46"}]}
+
+def test_submit_report_writes_atomically(tmp_path):
+    job = reports.submit_report(RESULT, tmp_path / "r.pdf")
+    assert reports.get_report(job.id) is job and job.status in {"pending", "running", "done"}
+    assert job.wait(60) == str(tmp_path / "r.pdf")
+    assert job.status == "done" and job.to_dict()["seconds"] >= 0
+    assert (tmp_path / "r.pdf").read_bytes()[:5] == b"%PDF-"
+    assert [p.name for p in tmp_path.iterdir()] == ["r.pdf"]       # nessun file temporaneo residuo
+
+def test_failed_report_reports_error(tmp_path):
+    job = reports.submit_report({**RESULT, "risk_score": "n/a"}, tmp_path / "bad.pdf")
+    with pytest.raises(ValueError):
+        job.wait(60)
+    assert job.status == "error" and "ValueError" in job.to_dict()["error"]
+    assert not any(tmp_path.iterdir())
+
+def test_route_returns_before_pdf(tmp_path, monkeypatch):
+    monkeypatch.setattr(call_agent, "LOG_DIR", tmp_path)
+    monkeypatch.setattr(call_agent, "OUTPUT_DIR", tmp_path)
+    monkeypatch.setattr(call_agent, "analyze_free_text", lambda payload: dict(RESULT))
+    result = call_agent.route({"mode": "free_text", "user_text": "we profile users"},
+                              generate_pdf=True, background_pdf=True)
+    job = reports.get_report(result["_meta"]["pdf_job"])
+    assert job.wait(60) == result["_meta"]["pdf"]
+    assert open(result["_meta"]["pdf"], "rb").read(5) == b"%PDF-"
+
+def test_pool_uses_spawn():
+    pool = reports._pool()
+    if isinstance(pool, reports.ProcessPoolExecutor):
+        assert pool._mp_context.get_start_method() == "spawn"
+
+def test_history_keeps_reports_still_rendering(tmp_path, monkeypatch):
+    gate = threading.Event()
+    pool = ThreadPoolExecutor(max_workers=1)
+    monkeypatch.setattr(reports, "_pool", lambda: pool)
+    monkeypatch.setattr(reports, "render_atomic", lambda result, path: gate.wait(10) and path)
+    monkeypatch.setattr(reports, "JOB_HISTORY", 2)
+    monkeypatch.setattr(reports, "_JOBS", reports.OrderedDict())
+    jobs = [reports.submit_report(RESULT, tmp_path / f"{i}.pdf") for i in range(4)]
+    assert all(reports.get_report(j.id) is j for j in jobs)         # nessuno concluso: nessuno scartato
+    gate.set()
+    assert [j.wait(10) for j in jobs] == [str(tmp_path / f"{i}.pdf") for i in range(4)]
+    jobs.append(reports.submit_report(RESULT, tmp_path / "4.pdf"))
+    jobs[-1].wait(10)
+    assert [reports.get_report(j.id) is j for j in jobs] == [False, False, False, True, True]
+    pool.shutdown()
@@ -0,0 +1,238 @@
+# test_retriever.py
+# Retrieval su un corpus finto (nessun modello reale: encoder deterministico)
+import json
+from pathlib import Path
+import numpy as np
+import pytest
+from lexie import retriever, build_index, embeddings
+
+VOCAB = ["consent", "transfer", "biometric", "oversight", "risk", "minors"]
+
+class FakeST:
+    """Bag-of-words su VOCAB: basta per verificare ranking e numero di encode."""
+    def __init__(self):
+        self.calls = 0
+    def encode(self, texts, **kw):
+        self.calls += 1
+        return np.array([[t.lower().count(w) + 0.01 for w in VOCAB] for t in texts], dtype=np.float32)
+
+def _use_model(monkeypatch, model):
+    monkeypatch.setattr(embeddings, "_model", model)
+    monkeypatch.setattr(embeddings, "_loaded", True)
+
+def _write_policy(root, name, texts):
+    d = root / name
+    d.mkdir(parents=True)
+    with (d / "chunks.jsonl").open("w", encoding="utf-8") as f:
+        for i, t in enumerate(texts):
+            f.write(json.dumps({"id": f"{name}.pdf::p{i+1}", "text": t, "page": i + 1}) + "\n")
+    return d
+
+@pytest.fixture(autouse=True)
+def _fresh_query_cache():
+    embeddings.QUERY_CACHE.clear()
+    yield
+    embeddings.QUERY_CACHE.clear()
+
+@pytest.fixture
+def corpus(tmp_path, monkeypatch):
+    monkeypatch.setattr(retriever, "POLICY_DIR", tmp_path)
+    _write_policy(tmp_path, "gdpr", ["consent consent lawful", "transfer third country", "minors consent", "security"])
+    _write_policy(tmp_path, "ai_act", ["human oversight", "risk management risk", "biometric identification"])
+    return tmp_path
+
+def test_lexical_fallback_quota(corpus, monkeypatch):
+    _use_model(monkeypatch, None)
+    out = retriever.retrieve_law_chunks("consent for minors and risk", ["gdpr", "ai_act"], top_k=4)
+    assert len(out) == 4
+    assert {c["source"] for c in out} == {"gdpr", "ai_act"}
+    assert out[0]["id"] == "gdpr.pdf::p3"
+
+def test_dense_uses_precomputed_matrix(corpus, monkeypatch):
+    fake = FakeST()
+    _use_model(monkeypatch, fake)
+    for name in ("gdpr", "ai_act"):
+        records = retriever.load_chunks(name)
+        build_index.build_policy_embeddings(records, corpus / name)
+    fake.calls = 0
+
+    out = retriever.retrieve_law_chunks("biometric biometric oversight", ["ai_act"], top_k=2, mode="dense")
+    assert fake.calls == 1  # solo la query
+    assert [c["page"] for c in out] == [3, 1]
+    assert out[0]["score"] >= out[1]["score"]
+
+def test_stale_manifest_is_ignored(corpus, monkeypatch):
+    fake = FakeST()
+    _use_model(monkeypatch, fake)
+    build_index.build_policy_embeddings(retriever.load_chunks("gdpr"), corpus / "gdpr")
+    (corpus / "gdpr" / "chunks.jsonl").write_text(
+        json.dumps({"id": "x::p1", "text": "transfer", "page": 1}) + "\n", encoding="utf-8")
+    out = retriever.retrieve_law_chunks("transfer", ["gdpr"], top_k=3)
+    assert [c["id"] for c in out] == ["x::p1"]
+
+def test_edited_text_with_same_ids_invalidates_embeddings(corpus, monkeypatch):
+    fake = FakeST()
+    _use_model(monkeypatch, fake)
+    records = retriever.load_chunks("gdpr")
+    build_index.build_policy_embeddings(records, corpus / "gdpr")
+    ids = [r["id"] for r in records]
+    assert retriever.load_embeddings("gdpr", ids, corpus / "gdpr", build_index.file_sha1(corpus / "gdpr" / "chunks.jsonl")) is not None
+
+    # stesso numero di chunk e stessi id, testo cambiato: la matrice non va riusata
+    records[0]["text"] = "biometric biometric"
+    with (corpus / "gdpr" / "chunks.jsonl").open("w", encoding="utf-8") as f:
+        f.writelines(json.dumps({k: r[k] for k in ("id", "text", "page")}) + "\n" for r in records)
+    digest = build_index.file_sha1(corpus / "gdpr" / "chunks.jsonl")
+    assert retriever.load_embeddings("gdpr", ids, corpus / "gdpr", digest) is None
+    out = retriever.retrieve_law_chunks("biometric", ["gdpr"], top_k=1, mode="dense")
+    assert out[0]["id"] == "gdpr.pdf::p1"
+
+def test_load_chunks_returns_copies(corpus, monkeypatch):
+    from lexie import retriever_con_torch
+    monkeypatch.setattr(retriever_con_torch, "POLICY_DIR", corpus)
+    for mod in (retriever, retriever_con_torch):
+        chunks = mod.load_chunks("gdpr")
+        chunks[0]["text"] = "changed"
+        chunks.pop()
+        assert mod.load_chunks("gdpr")[0]["text"] == "consent consent lawful" and len(mod.load_chunks("gdpr")) == 4
+
+def test_top_indices_stable_on_ties():
+    s = np.array([0.5, 0.9, 0.5, 0.1, 0.9], dtype=np.float32)
+    assert retriever._top_indices(s, 5).tolist() == [1, 4, 0, 2, 3]
+    assert retriever._top_indices(s, 2).tolist() == [1, 4]
+    assert retriever._top_indices(s, 0).tolist() == []
+
+def test_corpus_registry_hits_and_reload(corpus):
+    from lexie.corpus import CorpusRegistry
+    reg = CorpusRegistry()
+    a = reg.get("gdpr", corpus)
+    assert reg.get("gdpr", corpus) is a
+    assert (reg.misses, reg.hits, reg.reloads) == (1, 1, 0)
+
+    with (corpus / "gdpr" / "chunks.jsonl").open("a", encoding="utf-8") as f:
+        f.write(json.dumps({"id": "gdpr.pdf::p5", "text": "erasure", "page": 5}) + "\n")
+    b = reg.get("gdpr", corpus)
+    assert b is not a and len(b) == 5
+    assert reg.stats()["reloads"] == 1
+
+def test_corpus_memo_is_per_version(corpus):
+    from lexie.corpus import CorpusRegistry
+    reg = CorpusRegistry()
+    calls = []
+    c = reg.get("ai_act", corpus)
+    c.memo("x", lambda cc: calls.append(1) or len(cc))
+    assert c.memo("x", lambda cc: calls.append(1) or len(cc)) == 3
+    assert len(calls) == 1
+
+def test_compact_index_is_memory_mapped(corpus, monkeypatch):
+    from lexie.corpus import CorpusRegistry, write_text_index
+    _use_model(monkeypatch, None)
+    records = retriever.load_chunks("gdpr")
+    write_text_index(records, corpus / "gdpr")
+
+    c = CorpusRegistry().get("gdpr", corpus)
+    assert c.mapped and len(c) == 4
+    assert c.chunk(1) == {**records[1]}
+    out = retriever.retrieve_law_chunks("transfer to a third country", ["gdpr"], top_k=1)
+    assert out[0]["id"] == "gdpr.pdf::p2"
+
+    # chunks.jsonl riscritto senza rigenerare l'indice: si torna al JSONL
+    (corpus / "gdpr" / "chunks.jsonl").write_text(
+        json.dumps({"id": "x::p1", "text": "transfer", "page": 1}) + "\n", encoding="utf-8")
+    c2 = CorpusRegistry().get("gdpr", corpus)
+    assert not c2.mapped and c2.ids == ["x::p1"]
+
+def test_rebuild_does_not_touch_mapped_files(corpus, monkeypatch):
+    from lexie.corpus import CorpusRegistry, write_text_index
+    _use_model(monkeypatch, None)
+    records = retriever.load_chunks("gdpr")
+    write_text_index(records, corpus / "gdpr")
+    old = CorpusRegistry().get("gdpr", corpus)
+    assert old.mapped
+
+    # rebuild più piccolo mentre il vecchio corpus è ancora in uso (file nuovi + rename)
+    (corpus / "gdpr" / "chunks.jsonl").write_text(
+        json.dumps({"id": "x::p1", "text": "erasure", "page": 1}) + "\n", encoding="utf-8")
+    write_text_index([{"id": "x::p1", "text": "erasure", "page": 1}], corpus / "gdpr")
+    assert [old.text(i) for i in range(4)] == [r["text"] for r in records]
+    new = CorpusRegistry().get("gdpr", corpus)
+    assert new.mapped and new.ids == ["x::p1"] and new.text(0) == "erasure"
+    assert not [p for p in (corpus / "gdpr").iterdir() if p.name.endswith(".tmp")]
+
+def test_retrieve_many_single_encode_matches_single_calls(corpus, monkeypatch):
+    fake = FakeST()
+    _use_model(monkeypatch, fake)
+    queries = {"g": "consent for minors", "a": "risk oversight", "both": "biometric transfer"}
+    pmap = {"g": ["gdpr"], "a": ["ai_act"], "both": ["gdpr", "ai_act"]}
+    ks = {"g": 2, "a": 1, "both": 3}
+    retriever.retrieve_many(queries, pmap, ks)  # riscalda le matrici dei corpus
+    embeddings.QUERY_CACHE.clear()
+    fake.calls = 0
+    got = retriever.retrieve_many(queries, pmap, ks)
+    assert fake.calls == 1
+    for q in queries:
+        one = retriever.retrieve_law_chunks(queries[q], pmap[q], top_k=ks[q])
+        assert [c["id"] for c in got[q]] == [c["id"] for c in one]
+        assert [c["score"] for c in got[q]] == pytest.approx([c["score"] for c in one], abs=1e-5)
+
+def test_hybrid_fuses_lexical_and_dense(corpus, monkeypatch):
+    fake = FakeST()
+    _use_model(monkeypatch, fake)
+    # "Art. 46" non esiste nel vocabolario dense: solo il BM25 lo vede
+    with (corpus / "gdpr" / "chunks.jsonl").open("a", encoding="utf-8") as f:
+        f.write(json.dumps({"id": "gdpr.pdf::p5", "text": "Art. 46 appropriate safeguards", "page": 5}) + "\n")
+    out = retriever.retrieve_law_chunks("Art. 46 transfer", ["gdpr"], top_k=2, mode="hybrid")
+    assert {c["page"] for c in out} == {2, 5}
+    dense = retriever.retrieve_law_chunks("Art. 46 transfer", ["gdpr"], top_k=2, mode="dense")
+    assert 5 not in [c["page"] for c in dense][:1]
+
+def test_hybrid_without_lexical_match_uses_dense_rank(corpus, monkeypatch):
+    _use_model(monkeypatch, FakeST())
+    out = retriever.retrieve_law_chunks("minors minors", ["ai_act", "gdpr"], top_k=2, mode="hybrid")
+    assert out[1]["id"] == "gdpr.pdf::p3"
+
+def test_ivf_candidates_in_dense_mode(corpus, monkeypatch):
+    _use_model(monkeypatch, FakeST())
+    monkeypatch.setattr(retriever, "ANN_INDEX", "ivf")
+    monkeypatch.setattr(retriever, "ANN_MIN_CHUNKS", 1)
+    monkeypatch.setattr(retriever, "ANN_NPROBE", 100)  # tutte le liste: identico all'esatto
+    out = retriever.retrieve_law_chunks("biometric biometric oversight", ["ai_act"], top_k=2, mode="dense")
+    assert [c["page"] for c in out] == [3, 1]
+
+def test_import_does_not_load_model():
+    import subprocess, sys
+    code = ("import sys, lexie.tools.analyze_document; from lexie import embeddings; "
+            "assert 'sentence_transformers' not in sys.modules; assert not embeddings._loaded")
+    cp = subprocess.run([sys.executable, "-c", code], cwd=str(Path(__file__).resolve().parents[1]),
+                        capture_output=True, text=True)
+    assert cp.returncode == 0, cp.stderr
+
+def test_warmup_reports_model_and_corpora(corpus, monkeypatch):
+    _use_model(monkeypatch, FakeST())
+    info = retriever.warmup(["gdpr", "ai_act"])
+    assert info["policies"]["gdpr"]["chunks"] == 4
+    assert "load_seconds" in info["model"]
+
+def test_query_cache_hits_and_eviction(corpus, monkeypatch):
+    fake = FakeST()
+    _use_model(monkeypatch, fake)
+    retriever.retrieve_law_chunks("risk  oversight", ["ai_act"], top_k=1)
+    fake.calls = 0
+    retriever.retrieve_law_chunks("risk oversight\n", ["ai_act"], top_k=1)  # stesso testo normalizzato
+    assert fake.calls == 0
+    st = embeddings.query_cache_stats()
+    assert st["hits"] == 1 and st["size"] == 1
+
+    small = embeddings.QueryCache(max_items=2)
+    for i in range(3):
+        small.put(small.key(f"q{i}"), np.ones(3))
+    assert small.get(small.key("q0")) is None
+    assert small.stats()["evictions"] == 1
+
+def test_query_cache_persistence(tmp_path):
+    path = tmp_path / "qcache.npz"
+    c = embeddings.QueryCache(max_items=4, path=path)
+    c.put(c.key("consent"), np.arange(3))
+    c.save()
+    back = embeddings.QueryCache(max_items=4, path=path)
+    assert back.get(back.key(" consent ")).tolist() == [0.0, 1.0, 2.0]
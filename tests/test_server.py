@@ -0,0 +1,104 @@
+# test_server.py
+# Servizio HTTP: health/ready, backpressure (429 a coda piena), polling dei job (route finta)
+import http.client
+import json
+import threading
+import urllib.error
+import urllib.request
+import pytest
+from urllib.parse import urlparse
+from lexie import server
+
+@pytest.fixture
+def srv():
+    gate = threading.Event()
+    started = threading.Event()
+
+    def fake_route(payload, generate_pdf=False, **kw):
+        started.set()
+        gate.wait(10)
+        return {"risk_score": 10, "echo": payload.get("user_text") or payload.get("document_path")}
+
+    service = server.AnalysisService(workers=1, queue_size=1, route_fn=fake_route).start(warm=False)
+    httpd = server.make_server("127.0.0.1", 0, service)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{httpd.server_port}", gate, started
+    gate.set()
+    httpd.shutdown()
+    httpd.server_close()
+    service.stop()
+
+def _call(url, body=None, headers=None):
+    data = body if isinstance(body, bytes) or body is None else json.dumps(body).encode()
+    req = urllib.request.Request(url, data=data, headers=headers or {"Content-Type": "application/json"})
+    try:
+        with urllib.request.urlopen(req, timeout=10) as r:
+            return r.status, json.loads(r.read())
+    except urllib.error.HTTPError as e:
+        return e.code, json.loads(e.read())
+
+def _raw(base, headers, body=b""):
+    # richiesta con header scelti a mano (urllib calcola sempre Content-Length)
+    conn = http.client.HTTPConnection(urlparse(base).netloc, timeout=5)
+    conn.putrequest("POST", "/analyze/free_text")
+    for k, v in headers.items():
+        conn.putheader(k, v)
+    conn.endheaders(body)
+    r = conn.getresponse()
+    out = r.status, json.loads(r.read())
+    conn.close()
+    return out
+
+def test_health_ready_and_validation(srv):
+    base, gate, _ = srv
+    assert _call(base + "/ready") == (200, {"ready": True})
+    code, body = _call(base + "/health")
+    assert code == 200 and body["workers"] == 1 and body["queue_size"] == 1
+    assert _call(base + "/analyze/free_text", {"user_text": ""})[0] == 400
+    assert _call(base + "/analyze/free_text", b"{not json")[0] == 400
+    assert _call(base + "/jobs/nope")[0] == 404
+
+def test_queue_full_returns_429_then_jobs_complete(srv):
+    base, gate, started = srv
+    code, first = _call(base + "/analyze/free_text?wait=0", {"user_text": "one"})
+    assert code == 202 and started.wait(5)                 # il worker è occupato
+    assert _call(base + "/analyze/free_text?wait=0", {"user_text": "two"})[0] == 202   # in coda
+    code, body = _call(base + "/analyze/free_text?wait=0", {"user_text": "three"})
+    assert code == 429 and "queue full" in body["error"]
+
+    gate.set()
+    code, body = _call(base + "/analyze/document", b"%PDF-1.4 stub", {"Content-Type": "application/pdf"})
+    assert code == 200 and body["status"] == "done" and body["result"]["echo"].endswith(".pdf")
+    code, body = _call(base + f"/jobs/{first['job_id']}")
+    assert body["status"] == "done" and body["result"]["echo"] == "one"
+
+def test_content_length_is_validated(srv):
+    base, _, _ = srv
+    assert _raw(base, {"Content-Type": "application/json"})[0] == 411
+    for bad in ("-1", "abc", "1e3"):
+        code, body = _raw(base, {"Content-Length": bad})
+        assert code == 400 and "Content-Length" in body["error"]
+    assert _raw(base, {"Content-Length": str(11 * 1024 * 1024)})[0] == 413
+
+def test_document_path_confined_to_document_dir(srv, tmp_path, monkeypatch):
+    base, gate, _ = srv
+    monkeypatch.setattr(server, "SERVER_DOCUMENT_DIR", tmp_path)
+    gate.set()
+    for path in ("/etc/passwd", "../secret.pdf", str(tmp_path.parent / "x.pdf")):
+        code, body = _call(base + "/analyze/document", {"document_path": path})
+        assert code == 403 and "inside" in body["error"]
+    code, body = _call(base + "/analyze/document", {"document_path": "vendors/a.pdf"})
+    assert code == 404 and "not found" in body["error"]           # controllato prima di accodare il job
+    (tmp_path / "vendors").mkdir()
+    (tmp_path / "vendors" / "a.pdf").write_bytes(b"%PDF-1.4 stub")
+    code, body = _call(base + "/analyze/document", {"document_path": "vendors/a.pdf"})
+    assert code == 200 and body["result"]["echo"] == str(tmp_path.resolve() / "vendors" / "a.pdf")
+
+def test_bad_payload_types_return_400_and_drop_uploads(srv, tmp_path, monkeypatch):
+    base, gate, _ = srv
+    monkeypatch.setattr(server, "UPLOAD_DIR", tmp_path)
+    code, body = _call(base + "/analyze/free_text", {"user_text": "x", "top_k": [1]})
+    assert code == 400 and "int()" in body["error"]
+    monkeypatch.setattr(server.call_agent, "_validate", lambda p: int(p.get("top_k", [1])))
+    code, _ = _call(base + "/analyze/document", b"%PDF-1.4 stub", {"Content-Type": "application/pdf"})
+    assert code == 400 and not any(tmp_path.iterdir())             # nessun upload orfano
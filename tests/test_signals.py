@@ -0,0 +1,43 @@
+# test_signals.py
+# KeywordScanner: hit con offset in un passaggio, priorità delle etichette, frasi-segnale deduplicate
+from tools.signals import KeywordScanner, GDPR_SIGNALS, LAW_SIGNALS, signal_lines
+from tools.postprocess import _infer_theme, _infer_theme_from_text
+
+def test_hits_with_offsets_and_labels():
+    sc = KeywordScanner({"a": [r"\bconsent\w*"], "b": [r"third\s+countr\w*"]})
+    text = "Consent is needed. Transfers to third countries."
+    assert sc.hits(text) == [(0, 7, "a"), (32, 47, "b")]
+    assert sc.found(text) == {"a", "b"} and sc.count(text) == 2
+    assert sc.first(text, order=["b", "a"]) == "b"
+
+def test_literal_aliases_match_substrings():
+    sc = KeywordScanner({"x": ["art.30", "under 16"]}, literal=True)
+    assert sc.found("see ART.30 and under 16s") == {"x"}
+    assert sc.found("art 30") == set()
+
+def test_signal_lines_dedup_and_stop():
+    text = "We rely on consent. Nothing here.\nWe rely on CONSENT.\nPersonal data is kept. DPIA done."
+    assert signal_lines(text, GDPR_SIGNALS, 20) == ["We rely on consent.", "Personal data is kept.", "DPIA done."]
+    assert signal_lines(text, GDPR_SIGNALS, 1) == ["We rely on consent."]
+    # keyword spezzata da un separatore: non conta
+    assert signal_lines("legal\nbasis", GDPR_SIGNALS) == []
+
+def test_hits_crossing_a_separator_do_not_hide_the_next_sentence():
+    # "personal\ndata" scavalca il separatore e consuma l'inizio di "data subject"
+    assert signal_lines("data\n!. personal\ndata subject ", GDPR_SIGNALS) == ["data subject"]
+    assert signal_lines("consent.\nlegal\nbasis. art.\n5 personal data", GDPR_SIGNALS) == ["consent.", "5 personal data"]
+
+def test_law_signals_cover_both_acts():
+    assert LAW_SIGNALS.found("High-risk AI systems process personal data.") == {"gdpr", "ai_act"}
+
+def test_theme_inference_priority():
+    assert _infer_theme({"title": "Facial profiling of users"}) == "biometric"
+    assert _infer_theme({"title": "Retention and sharing"}) == "retention"
+    assert _infer_theme_from_text("Trasferimento verso paesi terzi e sicurezza") == "transfer"
+    assert _infer_theme_from_text("nothing relevant") is None
+
+def test_overlapping_aliases_keep_table_priority():
+    # "accesso" consuma la "o" di "outside": il confronto `k in s` trovava comunque il trasferimento
+    assert _infer_theme_from_text("accessoutside eu ") == "transfer"
+    sc = KeywordScanner({"a": ["abc"], "b": ["cd"]}, literal=True)
+    assert sc.found("abcd") == {"a", "b"} and sc.first("abcd", order=["b", "a"]) == "b"
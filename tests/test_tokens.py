@@ -0,0 +1,63 @@
+# test_tokens.py
+# Contatore token pluggable: budget del prompt (system + policy + snippet) e chunking guidato dal tokenizer
+import pytest
+from lexie import tokens, legal_analyzer_gpt as lag
+from lexie.tools import analyze_document
+
+class WordCounter:
+    """Tokenizer finto: una parola = un token."""
+    def count(self, text):
+        return len(text.split())
+    def truncate(self, text, n):
+        return " ".join(text.split()[:n])
+    def chars_per_token(self, sample=""):
+        n = self.count(sample)
+        return len(sample) / n if n else 4.0
+
+@pytest.fixture
+def counter():
+    def use(c):
+        tokens.set_counter(c)
+        return c
+    yield use
+    tokens.set_counter(None)
+
+def _ev(i, words=200):
+    return {"id": f"gdpr.pdf::p{i}", "page": i, "source": "gdpr", "text": " ".join(["lawful"] * words)}
+
+def _total(prompt):
+    return tokens.count_tokens(lag.SYSTEM_MSG) + tokens.count_tokens(prompt)
+
+def test_heuristic_matches_legacy_ratio(counter):
+    c = counter(tokens.CharHeuristic())
+    assert c.count("x" * 41) == 10 and c.count("") == 0
+    assert c.truncate("abcdefghij", 2) == "abcdefgh"
+
+def test_prompt_within_budget_truncates_policy_text(counter):
+    counter(WordCounter())
+    evs = [_ev(i) for i in range(3)]
+    prompt = lag.build_prompt(" ".join(["policy"] * 5000), evs, max_tokens=2000)
+    assert _total(prompt) <= 2000
+    assert prompt.count("gdpr.pdf::p") == 3          # base giuridica intatta
+    assert 0 < prompt.count("policy") < 5000
+
+def test_tail_snippets_dropped_before_policy_floor(counter):
+    counter(WordCounter())
+    evs = [_ev(i, words=300) for i in range(10)]
+    prompt = lag.build_prompt(" ".join(["policy"] * 2000), evs, max_tokens=2000)
+    assert _total(prompt) <= 2000
+    assert "gdpr.pdf::p0" in prompt and "gdpr.pdf::p9" not in prompt
+    assert prompt.count("policy") >= 500
+
+def test_no_budget_keeps_prompt_unchanged(counter):
+    counter(WordCounter())
+    text = " ".join(["policy"] * 50)
+    assert lag.build_prompt(text, [_ev(1)], max_tokens=0).count("policy") == 50
+
+def test_chunks_follow_tokenizer(counter):
+    counter(WordCounter())
+    text = " ".join(f"w{i:03d}." for i in range(1000))      # 5 caratteri + spazio per token
+    chunks = list(analyze_document._iter_chunks([text], max_tokens=100, overlap_tokens=10))
+    assert all(90 <= tokens.count_tokens(c) <= 100 for c in chunks[:-1])
+    assert chunks[0].split()[-10:] == chunks[1].split()[:10]  # overlap di 10 token
+    assert chunks[-1].endswith("w999.")